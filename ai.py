@@ -2,11 +2,19 @@
 import os
 import re
 import json
-import requests
+import time
+import logging
+import random
+import asyncio
+import httpx
 from dotenv import load_dotenv
 from dateutil import parser as dateparser
-from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, Tuple, List
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple, List, Iterable, Iterator, AsyncIterator
+import llm_cache
+import dates
+import metrics
+from matcher import IntentMatcher, KeywordAutomaton
 
 load_dotenv()
 
@@ -19,32 +27,221 @@ HEADERS = {
     "Content-Type": "application/json",
 }
 
+# Transport tuning: total time budget per call (all retries included) and retry count
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "3"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "16"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def _backoff(attempt: int, retry_after: Optional[str] = None, base: float = 0.5, cap: float = 8.0) -> float:
+    """Full-jitter exponential backoff; a numeric Retry-After from the server wins."""
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def _extract_text(data: Dict[str, Any]) -> str:
+    # Adjust extraction depending on API response shape
+    # Some OpenRouter responses follow openai-like structure:
+    if "choices" in data and len(data["choices"]) > 0:
+        return data["choices"][0]["message"].get("content", "")
+    return json.dumps(data)
+
+# One keep-alive connection pool per process, shared by every client instance
+_http_session = None
+_async_http = None
+
+def _shared_session() -> "requests.Session":
+    # requests is only needed by the sync client (Streamlit, scripts); the bots use httpx
+    import requests.adapters
+
+    global _http_session
+    if _http_session is None:
+        _http_session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=LLM_POOL_SIZE)
+        _http_session.mount("https://", adapter)
+        _http_session.mount("http://", adapter)
+    return _http_session
+
+def _shared_async_http() -> httpx.AsyncClient:
+    global _async_http
+    if _async_http is None or _async_http.is_closed:
+        _async_http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE),
+        )
+    return _async_http
+
 # --- Basic LLM wrapper for OpenRouter ---
 class OpenRouterClient:
-    def __init__(self, api_url=OPENROUTER_API_URL, api_key=OPENROUTER_API_KEY, model="gpt-4o-mini"):
+    def __init__(self, api_url=OPENROUTER_API_URL, api_key=OPENROUTER_API_KEY, model="gpt-4o-mini",
+                 retries: int = LLM_RETRIES, timeout: float = LLM_TIMEOUT):
         self.api_url = api_url
         self.api_key = api_key
         self.model = model
+        self.retries = retries
+        self.timeout = timeout
 
-    def chat(self, messages: list, max_tokens=512, temperature=0.2) -> str:
+    def _request(self, messages: list, max_tokens: int, temperature: float, stream: bool = False):
         payload = {
             "model": self.model,
             "messages": messages,
             "max_tokens": max_tokens,
             "temperature": temperature,
         }
+        if stream:
+            payload["stream"] = True
         headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
-        resp = requests.post(self.api_url, json=payload, headers=headers, timeout=30)
-        resp.raise_for_status()
-        data = resp.json()
-        # Adjust extraction depending on API response shape
-        # Some OpenRouter responses follow openai-like structure:
-        text = ""
-        if "choices" in data and len(data["choices"]) > 0:
-            text = data["choices"][0]["message"].get("content", "")
-        else:
-            text = json.dumps(data)
-        return text
+        return payload, headers
+
+    @metrics.timed(metrics.LLM_SECONDS, call="chat")
+    def chat(self, messages: list, max_tokens=512, temperature=0.2, timeout: Optional[float] = None) -> str:
+        """
+        Pooled keep-alive POST with retries on 429/5xx and network errors.
+        `timeout` is the budget for the whole call, retries included.
+        """
+        import requests
+
+        payload, headers = self._request(messages, max_tokens, temperature)
+        deadline = time.monotonic() + (timeout or self.timeout)
+        for attempt in range(self.retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("LLM call exceeded its time budget")
+            try:
+                resp = _shared_session().post(self.api_url, json=payload, headers=headers, timeout=remaining)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                time.sleep(min(_backoff(attempt), max(0.0, deadline - time.monotonic())))
+                continue
+            if resp.status_code in RETRY_STATUSES and attempt < self.retries:
+                time.sleep(min(_backoff(attempt, resp.headers.get("Retry-After")), max(0.0, deadline - time.monotonic())))
+                continue
+            resp.raise_for_status()
+            data = resp.json()
+            metrics.record_usage(data)
+            return _extract_text(data)
+
+    def chat_stream(self, messages: list, max_tokens=512, temperature=0.2,
+                    timeout: Optional[float] = None) -> Iterator[str]:
+        """
+        Streamed (SSE) completion: yields content pieces as they arrive.
+        Retries happen only before the first piece; `timeout` bounds the wait
+        for the response and for each next piece.
+        """
+        import requests
+
+        payload, headers = self._request(messages, max_tokens, temperature, stream=True)
+        deadline = time.monotonic() + (timeout or self.timeout)
+        for attempt in range(self.retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("LLM call exceeded its time budget")
+            try:
+                resp = _shared_session().post(self.api_url, json=payload, headers=headers,
+                                              timeout=remaining, stream=True)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                time.sleep(min(_backoff(attempt), max(0.0, deadline - time.monotonic())))
+                continue
+            with resp:
+                if resp.status_code in RETRY_STATUSES and attempt < self.retries:
+                    time.sleep(min(_backoff(attempt, resp.headers.get("Retry-After")), max(0.0, deadline - time.monotonic())))
+                    continue
+                resp.raise_for_status()
+                # SSE is UTF-8 by spec; requests would guess latin-1 without a charset
+                for line in resp.iter_lines():
+                    piece = _sse_delta(line.decode("utf-8"))
+                    if piece is _SSE_DONE:
+                        return
+                    if piece:
+                        yield piece
+            return
+
+# --- Server-sent events of a streamed completion ---
+_SSE_DONE = object()
+
+def _sse_delta(line: str):
+    """Content piece from one SSE line, _SSE_DONE at the end, None for anything else."""
+    if not line or not line.startswith("data:"):
+        return None  # blank separators and ": keep-alive" comments
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return _SSE_DONE
+    try:
+        choices = json.loads(data).get("choices") or [{}]
+    except ValueError:
+        return None
+    return (choices[0].get("delta") or {}).get("content")
+
+class AsyncOpenRouterClient(OpenRouterClient):
+    """Same API as OpenRouterClient, but `await client.chat(...)`; for the async bots."""
+
+    @metrics.timed(metrics.LLM_SECONDS, call="chat")
+    async def chat(self, messages: list, max_tokens=512, temperature=0.2, timeout: Optional[float] = None) -> str:
+        payload, headers = self._request(messages, max_tokens, temperature)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        for attempt in range(self.retries + 1):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError("LLM call exceeded its time budget")
+            try:
+                resp = await _shared_async_http().post(self.api_url, json=payload, headers=headers, timeout=remaining)
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(min(_backoff(attempt), max(0.0, deadline - loop.time())))
+                continue
+            if resp.status_code in RETRY_STATUSES and attempt < self.retries:
+                await asyncio.sleep(min(_backoff(attempt, resp.headers.get("Retry-After")), max(0.0, deadline - loop.time())))
+                continue
+            resp.raise_for_status()
+            data = resp.json()
+            metrics.record_usage(data)
+            return _extract_text(data)
+
+    async def chat_stream(self, messages: list, max_tokens=512, temperature=0.2,
+                          timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """async for piece in client.chat_stream(...): same contract as the sync version."""
+        payload, headers = self._request(messages, max_tokens, temperature, stream=True)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        started = False
+        for attempt in range(self.retries + 1):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError("LLM call exceeded its time budget")
+            try:
+                async with _shared_async_http().stream("POST", self.api_url, json=payload, headers=headers,
+                                                       timeout=remaining) as resp:
+                    if resp.status_code in RETRY_STATUSES and attempt < self.retries:
+                        delay = _backoff(attempt, resp.headers.get("Retry-After"))
+                    else:
+                        resp.raise_for_status()
+                        async for line in resp.aiter_lines():
+                            piece = _sse_delta(line)
+                            if piece is _SSE_DONE:
+                                return
+                            if piece:
+                                started = True
+                                yield piece
+                        return
+            except httpx.TransportError:
+                if started or attempt == self.retries:
+                    raise  # a retry would repeat text the caller already has
+                delay = _backoff(attempt)
+            await asyncio.sleep(min(delay, max(0.0, deadline - loop.time())))
+
+async def aclose_http():
+    """Close the shared async pool (call on bot shutdown)."""
+    global _async_http
+    if _async_http is not None:
+        await _async_http.aclose()
+        _async_http = None
 
 # --- Intent recognition via regex + LLM fallback ---
 INTENT_PATTERNS = {
@@ -59,13 +256,10 @@ INTENT_PATTERNS = {
     ]
 }
 
+INTENT_MATCHER = IntentMatcher(INTENT_PATTERNS)
+
 def regex_intent(text: str) -> Optional[str]:
-    t = text.lower()
-    for intent, patterns in INTENT_PATTERNS.items():
-        for p in patterns:
-            if re.search(p, t):
-                return intent
-    return None
+    return INTENT_MATCHER.match(text)
 
 # --- Entity extraction: amount, category, date, note ---
 CURRENCY_RE = r"(?P<amount>\d+(?:[.,]\d{1,2})?)\s*(?:₽|rub|руб|rubles|eur|€|\$|usd)?"
@@ -77,13 +271,13 @@ CATEGORY_KEYWORDS = {
     "income": ["зарплата", "доход", "прибыль"],
     "others": []
 }
+CATEGORY_MATCHER = KeywordAutomaton.from_categories(CATEGORY_KEYWORDS)
 
-DAY_KEYWORDS = {
-    "вчера": -1,
-    "сегодня": 0,
-    "позавчера": -2,
-    "завтра": 1
-}
+def build_vocabulary(user_categories: Iterable[str] = ()) -> KeywordAutomaton:
+    """Built-in keywords merged with the user's own category names."""
+    return KeywordAutomaton.from_categories(CATEGORY_KEYWORDS, extra=user_categories)
+
+DAY_KEYWORDS = dates.RELATIVE_DAYS
 
 def extract_amount(text: str) -> Optional[float]:
     m = re.search(CURRENCY_RE, text.replace(",", "."))
@@ -95,49 +289,115 @@ def extract_amount(text: str) -> Optional[float]:
     return None
 
 def extract_date(text: str, ref: datetime = None) -> Optional[datetime]:
-    ref = ref or datetime.now()
-    t = text.lower()
-    for k, off in DAY_KEYWORDS.items():
-        if k in t:
-            return (ref + timedelta(days=off)).replace(hour=12, minute=0, second=0, microsecond=0)
-    # try dateutil
-    try:
-        d = dateparser.parse(text, fuzzy=True, default=ref)
-        return d
-    except Exception:
-        return None
+    # None when the text has no date; callers default to today
+    return dates.parse_date(text, ref)
 
-def extract_category(text: str) -> str:
+def extract_category(text: str, vocabulary: KeywordAutomaton = None) -> str:
     t = text.lower()
-    for cat, keys in CATEGORY_KEYWORDS.items():
-        for k in keys:
-            if k in t:
-                return cat
+    hit = (vocabulary or CATEGORY_MATCHER).first(t)
+    if hit:
+        return hit
     # fallback: try to grab noun after 'на' or 'для'
     m = re.search(r"(?:на|для)\s+([а-яa-zA-Z\-]+)", t)
     if m:
         return m.group(1)
     return "others"
 
-def extract_entities(text: str) -> Dict[str, Any]:
-    amount = extract_amount(text)
+# --- Confidence scores for the regex extractors (0..1) ---
+NUMBER_RE = r"\d+(?:[.,]\d{1,2})?"
+CURRENCY_MARK_RE = NUMBER_RE + r"\s*(?:₽|rub|руб|rubles|eur|€|\$|usd)"
+
+def amount_confidence(text: str) -> float:
+    t = text.lower().replace(",", ".")
+    numbers = re.findall(NUMBER_RE, t)
+    if not numbers:
+        return 0.0
+    if re.search(CURRENCY_MARK_RE, t):
+        return 1.0
+    return 0.9 if len(numbers) == 1 else 0.4
+
+def category_confidence(text: str, category: str, vocabulary: KeywordAutomaton = None) -> float:
+    if category != "others" and (vocabulary or CATEGORY_MATCHER).first(text) == category:
+        return 1.0  # keyword hit
+    if category != "others":
+        return 0.5  # guessed from "на/для ..."
+    return 0.0
+
+def date_confidence(text: str, date: Optional[datetime]) -> float:
+    # dates.parse_date only returns explicit dates, never a guess
+    return 1.0 if date is not None else 0.0
+
+def extract_entities(text: str, vocabulary: KeywordAutomaton = None) -> Dict[str, Any]:
     date = extract_date(text)
-    category = extract_category(text)
+    # cut the date out first so "3 марта 250" is not read as amount 3
+    found = dates.find_date(text)
+    rest = text[:found[1][0]] + " " + text[found[1][1]:] if found else text
+    amount = extract_amount(rest)
+    category = extract_category(text, vocabulary)
     # note: remove amount and date tokens to get note
-    note = text
+    note = re.sub(r"\s+", " ", rest)
     if amount is not None:
         note = re.sub(CURRENCY_RE, "", note, flags=re.IGNORECASE)
-    # remove date words heuristically
-    for k in DAY_KEYWORDS.keys():
-        note = note.replace(k, "")
     return {
         "amount": amount,
         "category": category,
         "date": date,
-        "note": note.strip()
+        "note": note.strip(),
+        "confidence": {
+            "amount": amount_confidence(rest) if amount is not None else 0.0,
+            "category": category_confidence(text, category, vocabulary),
+            "date": date_confidence(text, date),
+        },
     }
 
+# --- Tiered parsing: regex fast path, LLM only for ambiguous input ---
+FAST_PATH_CONFIDENCE = float(os.getenv("FAST_PATH_CONFIDENCE", "0.8"))
+# Fields that must reach FAST_PATH_CONFIDENCE for the regex result to be used as is
+REQUIRED_FIELDS = {
+    "добавить_трату": ("intent", "amount", "category"),
+    "показать_аналитику": ("intent",),
+    "дать_совет": ("intent",),
+}
+
+def regex_parse(text: str, vocabulary: KeywordAutomaton = None) -> Dict[str, Any]:
+    """extract_entities + intent with per-field confidence; no network."""
+    parsed = extract_entities(text, vocabulary)
+    conf = parsed["confidence"]
+    intent = regex_intent(text)
+    if intent:
+        conf["intent"] = 1.0
+    elif conf["amount"] >= FAST_PATH_CONFIDENCE and conf["category"] >= FAST_PATH_CONFIDENCE:
+        # "кофе 250": a bare amount with a known category is an expense
+        intent, conf["intent"] = "добавить_трату", 0.9
+    else:
+        conf["intent"] = 0.0
+    if conf["date"] < FAST_PATH_CONFIDENCE:
+        parsed["date"] = None  # low-confidence guess; callers default to today
+    parsed["intent"] = intent
+    return parsed
+
+def is_confident(parsed: Dict[str, Any]) -> bool:
+    fields = REQUIRED_FIELDS.get(parsed.get("intent"))
+    return bool(fields) and all(parsed["confidence"].get(f, 0.0) >= FAST_PATH_CONFIDENCE for f in fields)
+
+def parse_message(text: str, client: Optional[OpenRouterClient] = None) -> Dict[str, Any]:
+    """
+    Regex first; ai_extract_with_llm only when the regex result is not confident.
+    The answering tier is returned in "tier" ("regex" | "llm") and logged.
+    """
+    started = time.perf_counter()
+    parsed = regex_parse(text)
+    if is_confident(parsed):
+        parsed["tier"] = "regex"
+    else:
+        parsed = dict(ai_extract_with_llm(text, client, intent=parsed["intent"]), tier="llm")
+    logging.info(f"[PARSE] tier={parsed['tier']} {(time.perf_counter() - started) * 1000:.2f}ms")
+    return parsed
+
 # --- Prompt templates ---
+# Bump when PROMPT_TEMPLATES or the cached value change: it is part of the LLM cache key
+# ("2": the cache holds the parsed JSON object, not the raw reply)
+PROMPT_VERSION = "2"
 PROMPT_TEMPLATES = {
     "добавить_трату": (
         "Ты — ассистент для управления личными финансами. "
@@ -167,21 +427,28 @@ def ai_extract_with_llm(text: str, client: Optional[OpenRouterClient] = None, in
     messages = [{"role":"system","content":"You are a JSON-output assistant for finance parsing."},
                 {"role":"user","content":prompt}]
     try:
-        raw = client.chat(messages, max_tokens=300)
-        # try parse JSON from raw text
-        j = None
+        cache_key = llm_cache.make_key(text, client.model, f"{intent}:{PROMPT_VERSION}")
+        j = llm_cache.cache.get(cache_key)
         try:
-            jpos = raw.find("{")
-            if jpos != -1:
-                jtext = raw[jpos:]
-                j = json.loads(jtext)
+            if j is None:
+                raw = client.chat(messages, max_tokens=300)
+                # try parse JSON from raw text
+                jpos = raw.find("{")
+                if jpos != -1:
+                    jtext = raw[jpos:]
+                    j = json.loads(jtext)
+                if not isinstance(j, dict):
+                    raise ValueError("LLM reply is not a JSON object")
+                # only parsed replies are cached: a malformed one is asked again next time
+                llm_cache.cache.set(cache_key, j)
         except Exception:
             # last fallback — return best-effort using regex extractor
+            date = extract_date(text)
             j = {
                 "intent": intent,
                 "amount": extract_amount(text),
                 "category": extract_category(text),
-                "date": extract_date(text).isoformat() if extract_date(text) else None,
+                "date": date.isoformat() if date else None,
                 "note": text
             }
         if j:
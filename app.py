@@ -2,12 +2,61 @@ import streamlit as st
 import os
 import hmac
 import hashlib
+import pandas as pd
 from dotenv import load_dotenv
-from database import get_user, get_transactions, get_categories
+from database import (
+    get_user, get_transactions, get_categories, get_data_version, ensure_indexes,
+    totals_by_category, totals_by_period, income_vs_expense,
+)
 
 st.set_page_config(page_title="Secure Mini App", layout="wide")
 load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY").encode()
+# Сколько секунд доверяем закэшированной версии данных и самим данным.
+# VERSION_TTL — это и наибольшая задержка, с которой запись бота видна в Mini App
+VERSION_TTL = int(os.getenv("CACHE_VERSION_TTL", "2"))
+DATA_TTL = int(os.getenv("CACHE_DATA_TTL", "600"))
+
+# -------------------------------
+# Кэш данных
+# -------------------------------
+# Данные кэшируются по (user_id, version): бот поднимает users.version в том
+# же запросе, что и запись, поэтому новая версия сразу даёт промах кэша. Саму
+# версию перечитываем не чаще раза в VERSION_TTL секунд (один find_one по
+# индексу tg_id) — остальные перезапуски скрипта не ходят в базу вовсе.
+@st.cache_resource
+def init_db():
+    ensure_indexes()
+
+
+@st.cache_data(ttl=VERSION_TTL, max_entries=10000, show_spinner=False)
+def load_version(user_id: int) -> int:
+    return get_data_version(user_id)
+
+
+@st.cache_data(ttl=DATA_TTL, max_entries=1000, show_spinner=False)
+def load_user(user_id: int, version: int):
+    return get_user(user_id)
+
+
+@st.cache_data(ttl=DATA_TTL, max_entries=1000, show_spinner=False)
+def load_categories(user_id: int, version: int):
+    return get_categories(user_id)
+
+
+@st.cache_data(ttl=DATA_TTL, max_entries=1000, show_spinner=False)
+def load_transactions(user_id: int, version: int):
+    return get_transactions(user_id)
+
+
+@st.cache_data(ttl=DATA_TTL, max_entries=1000, show_spinner=False)
+def load_analytics(user_id: int, version: int):
+    return {
+        "balance": income_vs_expense(user_id),
+        "by_category": totals_by_category(user_id),
+        "by_month": totals_by_period(user_id, "month"),
+    }
+
 
 st.title("💰 Финансовый ассистент (Mini App)")
 
@@ -31,20 +80,37 @@ if not hmac.compare_digest(expected_sig, sig):
     st.stop()
 
 user_id = int(user_id)
-user = get_user(user_id)
+init_db()
+version = load_version(user_id)
+user = load_user(user_id, version)
 st.success(f"Привет, {user['name']}! Доступ разрешён ✅")
 
 # -------------------------------
 # Показ категорий
 # -------------------------------
 st.subheader("Категории")
-cats = get_categories(user_id)
+cats = load_categories(user_id, version)
 st.write([c["name"] for c in cats])
 
+# -------------------------------
+# Аналитика (агрегаты считает Mongo)
+# -------------------------------
+st.subheader("Аналитика")
+analytics = load_analytics(user_id, version)
+balance = analytics["balance"]
+col_income, col_expense, col_balance = st.columns(3)
+col_income.metric("Доходы", f"{balance['income']:.2f} ₽")
+col_expense.metric("Расходы", f"{balance['expense']:.2f} ₽")
+col_balance.metric("Баланс", f"{balance['balance']:.2f} ₽")
+if analytics["by_category"]:
+    st.bar_chart(pd.DataFrame(analytics["by_category"]).set_index("category")["total"])
+if analytics["by_month"]:
+    st.line_chart(pd.DataFrame(analytics["by_month"]).set_index("period")["total"])
+
 # -------------------------------
 # Показ транзакций
 # -------------------------------
 st.subheader("Транзакции")
-txs = get_transactions(user_id)
+txs = load_transactions(user_id, version)
 for tx in txs:
     st.write(f"{tx['date']} — {tx['category']} — {tx['amount']} ₽")
@@ -0,0 +1,167 @@
+# asr.py
+# Оффлайн распознавание речи (Vosk). Модель загружается один раз на процесс
+# и разделяется пулом распознавателей; голосовые Telegram (OGG/Opus)
+# декодируются в памяти через libsndfile, без временных файлов.
+import os
+import io
+import json
+import asyncio
+import threading
+import functools
+import importlib.util
+from typing import Callable, Iterator, Optional, Tuple
+
+import metrics
+
+# numpy, soundfile и vosk импортируются при первом распознавании, а не при
+# импорте модуля: боту и utils они нужны только для голосовых.
+VOSK_AVAILABLE = importlib.util.find_spec("vosk") is not None
+
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "./models/vosk-small-ru")
+ASR_RECOGNIZERS = int(os.getenv("ASR_RECOGNIZERS", "2"))
+# ~0.25 с звука на порцию: частичные результаты приходят достаточно часто
+ASR_BLOCK_SECONDS = float(os.getenv("ASR_BLOCK_SECONDS", "0.25"))
+
+
+@functools.lru_cache(maxsize=None)
+def available(model_path: str = VOSK_MODEL_PATH) -> bool:
+    """
+    Установлены vosk, soundfile и numpy и модель на месте (без импорта
+    пакетов, как ocr.available): вызывается из обработчика в event loop,
+    сами пакеты загружает рабочий поток при первом распознавании.
+    """
+    if not all(importlib.util.find_spec(name) is not None for name in ("vosk", "soundfile", "numpy")):
+        return False
+    # как проверяет сам Vosk: final.mdl в am/ или в корне модели
+    return any(os.path.exists(os.path.join(model_path, *parts)) for parts in (("am", "final.mdl"), ("final.mdl",)))
+
+
+def decode_pcm(audio_bytes: bytes, block_seconds: float = ASR_BLOCK_SECONDS) -> Tuple[int, Iterator[bytes]]:
+    """
+    (частота, итератор порций 16-bit mono PCM) для OGG/Opus, WAV, FLAC и т.п.
+    Vosk сам приводит частоту к частоте модели, поэтому ресемплинг не нужен.
+    """
+    import numpy as np
+    import soundfile as sf
+
+    f = sf.SoundFile(io.BytesIO(audio_bytes))
+    blocksize = max(1, int(f.samplerate * block_seconds))
+
+    def frames():
+        with f:
+            for block in f.blocks(blocksize=blocksize, dtype="int16", always_2d=True):
+                if block.shape[1] > 1:
+                    block = block.mean(axis=1).astype(np.int16)
+                else:
+                    block = block[:, 0]
+                yield block.tobytes()
+
+    return f.samplerate, frames()
+
+
+class AsrEngine:
+    """
+    Общая для процесса модель Vosk (ленивая загрузка) и пул KaldiRecognizer
+    по частоте дискретизации. Одновременно работает не больше `size`
+    распознаваний, остальные ждут свободный распознаватель.
+    """
+
+    def __init__(self, model_path: str = VOSK_MODEL_PATH, size: int = ASR_RECOGNIZERS):
+        self.model_path = model_path
+        self.size = size
+        self._model = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = {}  # sample_rate -> [KaldiRecognizer]
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from vosk import Model, SetLogLevel
+
+                    SetLogLevel(-1)
+                    self._model = Model(self.model_path)
+        return self._model
+
+    def _acquire(self, sample_rate: int):
+        self._slots.acquire()
+        try:
+            with self._lock:
+                idle = self._idle.get(sample_rate)
+                if idle:
+                    return idle.pop()
+            from vosk import KaldiRecognizer
+
+            rec = KaldiRecognizer(self.model, sample_rate)
+            rec.SetWords(False)
+            return rec
+        except BaseException:
+            # модель не загрузилась или частота не подошла: слот не должен потеряться
+            self._slots.release()
+            raise
+
+    def _release(self, sample_rate: int, rec):
+        rec.Reset()
+        with self._lock:
+            self._idle.setdefault(sample_rate, []).append(rec)
+        self._slots.release()
+
+    def stream(self, audio_bytes: bytes) -> Iterator[Tuple[str, str]]:
+        """
+        Генератор событий ("partial", текст) по ходу декодирования и
+        ("final", весь текст) в конце. Промежуточные фразы (Result) копятся.
+        """
+        if not VOSK_AVAILABLE:
+            yield "final", ""
+            return
+        sample_rate, frames = decode_pcm(audio_bytes)
+        rec = self._acquire(sample_rate)
+        try:
+            phrases = []
+            last_partial = ""
+            for chunk in frames:
+                if rec.AcceptWaveform(chunk):
+                    text = json.loads(rec.Result()).get("text", "")
+                    if text:
+                        phrases.append(text)
+                        yield "partial", " ".join(phrases)
+                else:
+                    partial = json.loads(rec.PartialResult()).get("partial", "")
+                    if partial and partial != last_partial:
+                        last_partial = partial
+                        yield "partial", " ".join(phrases + [partial])
+            text = json.loads(rec.FinalResult()).get("text", "")
+            if text:
+                phrases.append(text)
+            yield "final", " ".join(phrases)
+        finally:
+            self._release(sample_rate, rec)
+
+    @metrics.timed(metrics.STAGE_SECONDS, stage="asr")
+    def transcribe(self, audio_bytes: bytes) -> str:
+        text = ""
+        for kind, text in self.stream(audio_bytes):
+            pass
+        return text
+
+    @metrics.timed(metrics.STAGE_SECONDS, stage="asr")
+    async def transcribe_async(self, audio_bytes: bytes, on_partial: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Распознаёт в потоке, не блокируя event loop. on_partial вызывается
+        в event loop с текущим текстом по мере поступления результатов.
+        """
+        loop = asyncio.get_running_loop()
+
+        def run():
+            text = ""
+            for kind, text in self.stream(bytes(audio_bytes)):
+                if kind == "partial" and on_partial is not None:
+                    loop.call_soon_threadsafe(on_partial, text)
+            return text
+
+        return await asyncio.to_thread(run)
+
+
+engine = AsrEngine()
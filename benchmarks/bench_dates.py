@@ -0,0 +1,78 @@
+# benchmarks/bench_dates.py
+# Micro-benchmark: ai.extract_date before (keywords + fuzzy dateutil) and
+# after (dates.parse_date, cold and memoized).
+#   python benchmarks/bench_dates.py [-n 2000]
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timedelta
+
+from dateutil import parser as dateparser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import dates
+
+MESSAGES = [
+    "кофе 250",
+    "вчера такси 450 руб",
+    "потратил 1200 на продукты 3 марта",
+    "обед 15.02.24 в кафе",
+    "кофе 7.10",
+    "в прошлую пятницу купил кофту за 2500",
+    "аптека 3 дня назад",
+    "зарплата пришла",
+    "сколько я потратил в этом месяце",
+]
+
+OLD_DAY_KEYWORDS = {"вчера": -1, "сегодня": 0, "позавчера": -2, "завтра": 1}
+
+
+def old_extract_date(text, ref=None):
+    """ai.extract_date as it was before dates.py."""
+    ref = ref or datetime.now()
+    t = text.lower()
+    for k, off in OLD_DAY_KEYWORDS.items():
+        if k in t:
+            return (ref + timedelta(days=off)).replace(hour=12, minute=0, second=0, microsecond=0)
+    try:
+        return dateparser.parse(text, fuzzy=True, default=ref)
+    except Exception:
+        return None
+
+
+def bench(fn, n, before=None):
+    best = float("inf")
+    for _ in range(3):
+        if before:
+            before()
+        started = time.perf_counter()
+        for _ in range(n):
+            for msg in MESSAGES:
+                fn(msg)
+        best = min(best, time.perf_counter() - started)
+    return best / (n * len(MESSAGES)) * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=2000, help="passes over the message set")
+    args = ap.parse_args()
+
+    ref = datetime.now()
+    print(f"{'message':40} {'dateutil':>22} {'dates.py':>12}")
+    for msg in MESSAGES:
+        print(f"{msg:40} {str(old_extract_date(msg, ref)):>22} {str(dates.parse_date(msg, ref)):>12}")
+    print()
+
+    old = bench(old_extract_date, max(1, args.n // 10))
+    day = ref.date()
+    cold = bench(lambda m: dates._find.__wrapped__(m.lower(), day), args.n)
+    memo = bench(dates.parse_date, args.n, before=dates._find.cache_clear)
+    print(f"dateutil fuzzy:        {old:8.2f} us/msg")
+    print(f"dates.py single pass:  {cold:8.2f} us/msg  ({old / cold:.0f}x)")
+    print(f"dates.py memoized:     {memo:8.2f} us/msg  ({old / memo:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
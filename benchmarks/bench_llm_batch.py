@@ -0,0 +1,62 @@
+# benchmarks/bench_llm_batch.py
+# Burst of messages against the stub LLM server with a provider concurrency
+# cap: one request per message vs llm_batch.BatchExtractor.
+#   python benchmarks/bench_llm_batch.py [-n 64] [--latency-ms 200] [--concurrency 4]
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import ai
+import stub_llm
+from llm_batch import BatchExtractor
+
+MESSAGES = [
+    "кофе 250", "такси 450 вчера", "обед в кафе 780", "аптека 1200 3 марта",
+    "купил кофту за 2500", "метро 62", "ужин 1500 в пятницу", "зарплата 90000",
+]
+
+
+async def run(args) -> None:
+    runner, url = await stub_llm.start(latency_ms=args.latency_ms, concurrency=args.concurrency,
+                                       bad_item_rate=args.bad_item_rate)
+    client = ai.AsyncOpenRouterClient(api_url=url, api_key="stub", model="stub")
+    texts = [MESSAGES[i % len(MESSAGES)] for i in range(args.n)]
+    stats = runner.app["stats"]
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(client.chat([{"role": "user", "content": t}]) for t in texts))
+        single = time.perf_counter() - started
+        single_requests = stats["requests"]
+
+        batcher = BatchExtractor(client, args.window_ms / 1000, args.batch)
+        started = time.perf_counter()
+        results = await asyncio.gather(*(batcher.extract(t) for t in texts))
+        batched = time.perf_counter() - started
+        batched_requests = stats["requests"] - single_requests
+    finally:
+        await ai.aclose_http()
+        await runner.cleanup()
+
+    fallbacks = sum(1 for r in results if r.get("fallback"))
+    print(f"{args.n} messages, stub latency {args.latency_ms:.0f}ms, provider concurrency {args.concurrency or 'unlimited'}")
+    print(f"one per message: {single_requests:4d} requests  {single * 1000:8.0f} ms")
+    print(f"batched ({args.batch}/{args.window_ms}ms): {batched_requests:4d} requests  {batched * 1000:8.0f} ms"
+          f"  fallbacks={fallbacks}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=64)
+    ap.add_argument("--latency-ms", type=float, default=200)
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--bad-item-rate", type=float, default=0.05)
+    ap.add_argument("--window-ms", type=int, default=30)
+    ap.add_argument("--batch", type=int, default=16)
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# benchmarks/datagen.py
+# Deterministic synthetic data for benchmarks: N users x M transactions,
+# chat messages in the shapes the bot receives, and signed Mini App initData.
+#   python benchmarks/datagen.py --users 10 --per-user 1000 > data.jsonl
+import sys
+import json
+import hmac
+import random
+import hashlib
+import argparse
+from datetime import date, timedelta
+from typing import Dict, Iterator, List
+from urllib.parse import quote
+
+CATEGORIES = {
+    "еда": ["кофе", "обед", "ужин", "кафе", "завтрак"],
+    "transport": ["такси", "метро", "автобус"],
+    "shopping": ["магазин", "кофта", "телефон"],
+    "health": ["аптека", "врач"],
+    "income": ["зарплата"],
+}
+WEIGHTS = {"еда": 50, "transport": 25, "shopping": 12, "health": 8, "income": 5}
+
+MESSAGE_TEMPLATES = [
+    "{kw} {amount}",
+    "{kw} {amount} руб",
+    "потратил {amount} на {kw}",
+    "вчера {kw} {amount}",
+    "{kw} {amount} {day} {month}",
+    "{kw} {amount} {day:02d}.{month_num:02d}",
+    "в прошлую пятницу {kw} за {amount}",
+    "сколько я потратил на {kw} в этом месяце",
+    "дай совет как экономить на {kw}",
+    "купил что-то непонятное",
+]
+MONTHS_GEN = ["января", "февраля", "марта", "апреля", "мая", "июня", "июля",
+              "августа", "сентября", "октября", "ноября", "декабря"]
+
+
+def _category(rng: random.Random) -> str:
+    return rng.choices(list(WEIGHTS), weights=list(WEIGHTS.values()))[0]
+
+
+def _amount(rng: random.Random, category: str) -> float:
+    if category == "income":
+        return float(rng.randrange(30000, 150000, 1000))
+    return float(round(rng.lognormvariate(6, 1), 2))
+
+
+def users(n: int, first_id: int = 100000) -> List[Dict]:
+    return [{"tg_id": first_id + i, "name": f"user{i}"} for i in range(n)]
+
+
+def transactions(n_users: int, per_user: int, seed: int = 42, days: int = 365,
+                 end: date = date(2026, 1, 1), first_id: int = 100000) -> Iterator[Dict]:
+    """per_user transactions per user, spread uniformly over the days before end."""
+    rng = random.Random(seed)
+    start = end - timedelta(days=days)
+    for u in range(n_users):
+        tg_id = first_id + u
+        for _ in range(per_user):
+            category = _category(rng)
+            yield {
+                "tg_id": tg_id,
+                "amount": _amount(rng, category),
+                "category": category,
+                "date": (start + timedelta(days=rng.randrange(days))).isoformat(),
+            }
+
+
+def messages(n: int, seed: int = 42) -> List[str]:
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        category = _category(rng)
+        month = rng.randrange(12)
+        out.append(rng.choice(MESSAGE_TEMPLATES).format(
+            kw=rng.choice(CATEGORIES[category]),
+            amount=int(_amount(rng, category)),
+            day=rng.randrange(1, 28),
+            month=MONTHS_GEN[month],
+            month_num=month + 1,
+        ))
+    return out
+
+
+def init_data(bot_token: str, user_id: int, auth_date: int = 1767225600) -> str:
+    """initData signed the way Telegram signs it (see utils.verify_telegram_init_data)."""
+    fields = {
+        "auth_date": str(auth_date),
+        "query_id": f"AAH{user_id}",
+        "user": quote(json.dumps({"id": user_id, "first_name": "Bench"}, separators=(",", ":"))),
+    }
+    check = "\n".join(f"{k}={fields[k]}" for k in sorted(fields))
+    secret = hashlib.sha256(bot_token.encode()).digest()
+    fields["hash"] = hmac.new(secret, check.encode(), hashlib.sha256).hexdigest()
+    return "&".join(f"{k}={v}" for k, v in fields.items())
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=10)
+    ap.add_argument("--per-user", type=int, default=1000)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--messages", type=int, default=0, help="print N chat messages instead of transactions")
+    args = ap.parse_args()
+    if args.messages:
+        for msg in messages(args.messages, args.seed):
+            print(msg)
+        return
+    for tx in transactions(args.users, args.per_user, args.seed):
+        sys.stdout.write(json.dumps(tx, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
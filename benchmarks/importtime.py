@@ -0,0 +1,154 @@
+# benchmarks/importtime.py
+# Cold-start report for the entry points, in the spirit of `python -X importtime`:
+# each target is imported in a fresh interpreter with -X importtime. The report
+# shows the import time, the packages it goes to, and heavy optional
+# dependencies that were imported eagerly instead of on first use.
+#   python benchmarks/importtime.py                    # all targets, exit 1 over budget
+#   python benchmarks/importtime.py --target bot --top 20
+#   python benchmarks/importtime.py --budget bot=600 --out importtime.json
+#   python -m pytest benchmarks/test_importtime.py     # the same rules as a test
+# Budgets are wall-clock milliseconds on the machine running the check; the
+# lazy-import list is machine independent.
+import os
+import ast
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+from typing import Dict, List
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# target -> (modules to import, extra env). app.py is a Streamlit script, so
+# its top-level imports are measured rather than the script itself.
+TARGETS = {
+    "bot": (["bot"], {"STORAGE_BACKEND": "sql"}),
+    "bot1": (["bot1"], {"STORAGE_BACKEND": "mongo"}),
+    "app": (None, {}),
+}
+BUDGET_MS = {"bot": 1200, "bot1": 5000, "app": 2500}
+
+# Media / AI / other-backend packages each entry point must load only on first use.
+# database opens a sync MongoClient at import; MongoStorage uses mongo_schema instead.
+MEDIA = ["pytesseract", "vosk", "soundfile", "numpy", "pydub", "openai"]
+LAZY = {
+    "bot": MEDIA + ["PIL", "pandas", "requests", "pymongo"],
+    "bot1": MEDIA + ["PIL", "pandas", "requests", "sqlalchemy", "telegram", "database"],
+    "app": ["pytesseract", "vosk", "soundfile", "pydub", "openai", "sqlalchemy", "telegram", "aiogram"],
+}
+
+CHILD = """
+import sys, time, json, importlib
+started = time.perf_counter()
+for name in sys.argv[1:]:
+    importlib.import_module(name)
+print(json.dumps({"ms": (time.perf_counter() - started) * 1000, "modules": sorted(sys.modules)}))
+"""
+
+
+def script_imports(path: str) -> List[str]:
+    """Top-level modules imported by a script (e.g. app.py), without running it."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names += [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.append(node.module)
+    return list(dict.fromkeys(names))
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """'import time: self [us] | cumulative | imported package' lines -> [{name, self_us, cumulative_us, depth}]."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append({"name": name.strip(), "depth": (len(name) - len(name.lstrip())) // 2,
+                     "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    return rows
+
+
+def run_once(modules: List[str], env: Dict) -> Dict:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD, *modules],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=300,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import of {modules} failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["rows"] = parse_importtime(proc.stderr)
+    return result
+
+
+def measure(name: str, repeat: int) -> Dict:
+    modules, extra = TARGETS[name]
+    modules = modules or script_imports(os.path.join(ROOT, f"{name}.py"))
+    env = dict(os.environ)
+    env.setdefault("SECRET_KEY", "importtime")
+    env.setdefault("TELEGRAM_BOT_TOKEN", "123456:importtime")
+    env.update(extra)
+    run_once(modules, env)  # warm-up: .pyc compilation is not part of a restart
+    runs = [run_once(modules, env) for _ in range(repeat)]
+    best = min(runs, key=lambda r: r["ms"])
+    packages = defaultdict(int)
+    for row in best["rows"]:
+        packages[row["name"].split(".")[0]] += row["self_us"]
+    loaded = set(best["modules"])
+    return {
+        "modules": modules,
+        "median_ms": statistics.median(r["ms"] for r in runs),
+        "min_ms": best["ms"],
+        "packages_ms": {k: v / 1000 for k, v in sorted(packages.items(), key=lambda kv: -kv[1])},
+        "slowest": sorted(best["rows"], key=lambda r: -r["self_us"]),
+        "eager": [pkg for pkg in LAZY[name] if pkg in loaded],
+    }
+
+
+def print_report(name: str, r: Dict, budget: float, top: int):
+    status = "ok" if r["median_ms"] <= budget and not r["eager"] else "FAIL"
+    print(f"{name}: {r['median_ms']:.0f} ms median (min {r['min_ms']:.0f}), budget {budget:.0f} ms  [{status}]")
+    print(f"  imports: {', '.join(r['modules'])}")
+    print("  by package: " + ", ".join(f"{k} {v:.0f}" for k, v in list(r["packages_ms"].items())[:top]))
+    print("  slowest modules (self ms):")
+    for row in r["slowest"][:top]:
+        print(f"    {row['self_us'] / 1000:8.1f}  {row['name']}")
+    if r["eager"]:
+        print(f"  imported eagerly, should load on first use: {', '.join(r['eager'])}")
+    print()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--target", choices=list(TARGETS), action="append")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--budget", action="append", default=[], help="name=ms, overrides the default budget")
+    ap.add_argument("--out", help="write results as JSON")
+    args = ap.parse_args()
+
+    budgets = dict(BUDGET_MS)
+    for item in args.budget:
+        name, ms = item.split("=")
+        budgets[name] = float(ms)
+    results, failed = {}, []
+    for name in args.target or list(TARGETS):
+        r = results[name] = measure(name, args.repeat)
+        print_report(name, r, budgets[name], args.top)
+        if r["median_ms"] > budgets[name] or r["eager"]:
+            failed.append(name)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({name: dict(r, slowest=r["slowest"][:50]) for name, r in results.items()}, f, indent=2)
+    if failed:
+        print(f"over budget or eager imports: {', '.join(failed)}")
+        sys.exit(1)
+    print("all targets within budget")
+
+
+if __name__ == "__main__":
+    main()
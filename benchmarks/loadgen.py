@@ -0,0 +1,341 @@
+# benchmarks/loadgen.py
+# Offline load generator: replays synthetic Telegram updates through the bot
+# handlers against a stub Bot API and the stub LLM (stub_llm.py), and reports
+# throughput and p50/p95/p99 handler latency per concurrency level.
+#   python benchmarks/loadgen.py --bot ptb --concurrency 1,8,32 --updates 300
+#   python benchmarks/loadgen.py --bot aiogram --storage sql --concurrency 1,16
+# The stub servers run in their own thread and event loop so they do not
+# compete with the handlers for the bot's loop.
+import os
+import io
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import statistics
+from typing import Dict, List
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import datagen
+import stub_llm
+
+TOKEN = "123456:loadgen"
+FIRST_USER = 500000
+
+
+# -------------------------------
+# Stub Bot API
+# -------------------------------
+def sample_voice() -> bytes:
+    import numpy as np
+    import soundfile as sf
+
+    t = np.linspace(0, 2, 32000, endpoint=False)
+    pcm = (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+    buf = io.BytesIO()
+    try:
+        sf.write(buf, pcm, 16000, format="OGG", subtype="OPUS")
+    except Exception:
+        buf = io.BytesIO()
+        sf.write(buf, pcm, 16000, format="WAV")  # libsndfile built without Opus
+    return buf.getvalue()
+
+
+def sample_photo() -> bytes:
+    from PIL import Image, ImageDraw
+
+    img = Image.new("RGB", (800, 600), "white")
+    draw = ImageDraw.Draw(img)
+    for i, line in enumerate(["КАФЕ ЛОФТ", "Капучино 250", "Круассан 190", "ИТОГО 440"]):
+        draw.text((60, 60 + i * 40), line, fill="black")
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def make_bot_api(latency_ms: float) -> web.Application:
+    """Just enough of the Bot API for the handlers: send/edit messages and file downloads."""
+    app = web.Application()
+    app["stats"] = {"calls": 0}
+    files = {"voice": sample_voice(), "photo": sample_photo()}
+    counter = {"message_id": 0}
+
+    async def params(request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        return dict(await request.post())
+
+    def message(chat_id, text) -> dict:
+        counter["message_id"] += 1
+        return {"message_id": counter["message_id"], "date": int(time.time()),
+                "chat": {"id": int(chat_id), "type": "private"}, "text": text}
+
+    async def method(request: web.Request) -> web.Response:
+        name = request.match_info["method"]
+        data = await params(request)
+        await asyncio.sleep(latency_ms / 1000)
+        app["stats"]["calls"] += 1
+        if name == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Stub", "username": "stub_bot"}
+        elif name in ("sendMessage", "editMessageText"):
+            result = message(data.get("chat_id", 0), data.get("text", ""))
+        elif name == "getFile":
+            file_id = data["file_id"]
+            result = {"file_id": file_id, "file_unique_id": file_id, "file_path": f"{file_id.split('_')[0]}/{file_id}"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def download(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency_ms / 1000)
+        kind = request.match_info["path"].split("/")[0]
+        return web.Response(body=files.get(kind, b""))
+
+    app.router.add_post("/bot{token}/{method}", method)
+    app.router.add_get("/file/bot{token}/{path:.*}", download)
+    return app
+
+
+class Stubs:
+    """Stub Bot API + stub LLM in a background thread with its own event loop."""
+
+    def __init__(self, bot_api_ms: float, llm_ms: float, llm_concurrency: int):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.runners = []
+        self.bot_api_url, self.bot_api = self._run(self._start_bot_api(bot_api_ms))
+        self.llm_url, self.llm = self._run(self._start_llm(llm_ms, llm_concurrency))
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def _start_bot_api(self, latency_ms):
+        app = make_bot_api(latency_ms)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        self.runners.append(runner)
+        return f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}", app
+
+    async def _start_llm(self, latency_ms, concurrency):
+        runner, url = await stub_llm.start(latency_ms=latency_ms, concurrency=concurrency)
+        self.runners.append(runner)
+        return url, runner.app
+
+    def counters(self) -> Dict:
+        return {"bot_api_calls": self.bot_api["stats"]["calls"], "llm_requests": self.llm["stats"]["requests"]}
+
+    def close(self):
+        for runner in self.runners:
+            self._run(runner.cleanup())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+def configure_env(args, stubs: Stubs, workdir: str):
+    """Bots read their settings at import time: point them at the stubs and a scratch DB."""
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": TOKEN,
+        "SECRET_KEY": "loadgen",
+        "OPENROUTER_API_KEY": "stub",
+        "OPENROUTER_API_URL": stubs.llm_url,
+        "STORAGE_BACKEND": args.storage,
+        "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.db"),
+        "LLM_RPM": str(args.llm_rpm),
+    })
+    if args.storage == "sql":
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'loadgen.db')}"
+    # stub_llm already imported ai -> llm_cache with the default path: start from an empty cache
+    import llm_cache
+    llm_cache.cache = llm_cache.LLMCache(os.environ["LLM_CACHE_PATH"])
+
+
+# -------------------------------
+# Synthetic updates
+# -------------------------------
+def parse_mix(spec: str) -> Dict[str, int]:
+    return {k: int(v) for k, v in (part.split("=") for part in spec.split(","))}
+
+
+def make_updates(n: int, mix: Dict[str, int], users: int, seed: int = 42) -> List[Dict]:
+    rng = random.Random(seed)
+    texts = datagen.messages(n, seed)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=n)
+    updates = []
+    for i, kind in enumerate(kinds):
+        uid = FIRST_USER + rng.randrange(users)
+        msg = {"message_id": i + 1, "date": int(time.time()),
+               "chat": {"id": uid, "type": "private"},
+               "from": {"id": uid, "is_bot": False, "first_name": f"load{uid}"}}
+        if kind == "voice":
+            msg["voice"] = {"file_id": f"voice_{i}", "file_unique_id": f"v{i}", "duration": 2}
+        elif kind == "photo":
+            # every other photo repeats (forwarded receipts), the rest are unique
+            uniq = f"p{i % 10}" if i % 2 else f"p{i}"
+            msg["photo"] = [{"file_id": f"photo_{i}", "file_unique_id": uniq, "width": 800, "height": 600}]
+        elif kind == "start":
+            msg["text"] = "/start"
+        elif kind == "add":
+            amount = rng.randrange(100, 3000)
+            msg["text"] = f"/add {amount} {rng.choice(['кофе', 'такси', 'обед', 'аптека'])}"
+        else:
+            msg["text"] = texts[i]
+        updates.append({"kind": kind, "update": {"update_id": i + 1, "message": msg}})
+    return updates
+
+
+# -------------------------------
+# Drivers
+# -------------------------------
+class PtbDriver:
+    """bot.py (python-telegram-bot): handlers called directly, as the Application would."""
+
+    async def setup(self, stubs: Stubs):
+        from telegram.ext import ApplicationBuilder, CallbackContext
+        import bot
+
+        self.bot = bot
+        self.CallbackContext = CallbackContext
+        self.app = (
+            ApplicationBuilder().token(TOKEN).request(bot.InstrumentedRequest())
+            .base_url(f"{stubs.bot_api_url}/bot").base_file_url(f"{stubs.bot_api_url}/file/bot")
+            .build()
+        )
+        await self.app.initialize()
+        await bot.on_startup(self.app)
+        self.handlers = {"text": bot.handle_message, "voice": bot.handle_voice, "photo": bot.handle_photo}
+
+    async def handle(self, kind: str, data: Dict):
+        from telegram import Update
+
+        update = Update.de_json(data, self.app.bot)
+        context = self.CallbackContext.from_update(update, self.app)
+        await self.handlers[kind](update, context)
+
+    async def close(self):
+        await self.bot.on_shutdown(self.app)
+        await self.app.shutdown()
+
+
+class AiogramDriver:
+    """bot1.py (aiogram): updates fed through the Dispatcher, so filters and routing count too."""
+
+    async def setup(self, stubs: Stubs):
+        from aiogram import Bot
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+        import bot1
+
+        self.bot1 = bot1
+        session = AiohttpSession(api=TelegramAPIServer.from_base(stubs.bot_api_url))
+        self.bot = Bot(token=TOKEN, session=session)
+        await bot1.storage.ensure_indexes()
+
+    async def handle(self, kind: str, data: Dict):
+        from aiogram import types
+
+        update = types.Update.model_validate(data, context={"bot": self.bot})
+        await self.bot1.dp.feed_update(self.bot, update)
+
+    async def close(self):
+        await self.bot.session.close()
+        await self.bot1.storage.close()
+
+
+DRIVERS = {"ptb": PtbDriver, "aiogram": AiogramDriver}
+DEFAULT_MIX = {"ptb": "text=70,voice=10,photo=20", "aiogram": "start=20,add=80"}
+
+
+async def run_level(driver, updates: List[Dict], concurrency: int) -> Dict:
+    """Closed loop: `concurrency` workers, each sends the next update once its previous one is handled."""
+    queue = asyncio.Queue()
+    for item in updates:
+        queue.put_nowait(item)
+    latencies, errors = [], {}
+
+    async def worker():
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            try:
+                await driver.handle(item["kind"], item["update"])
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "concurrency": concurrency,
+        "updates": len(updates),
+        "throughput": len(updates) / wall,
+        "p50_ms": q[49],
+        "p95_ms": q[94],
+        "p99_ms": q[98],
+        "errors": errors,
+    }
+
+
+async def run(args, stubs: Stubs) -> List[Dict]:
+    driver = DRIVERS[args.bot]()
+    await driver.setup(stubs)
+    mix = parse_mix(args.mix or DEFAULT_MIX[args.bot])
+    results = []
+    try:
+        for level in [int(c) for c in args.concurrency.split(",")]:
+            before = stubs.counters()
+            result = await run_level(driver, make_updates(args.updates, mix, args.users, seed=level), level)
+            after = stubs.counters()
+            result.update({k: after[k] - before[k] for k in after})
+            results.append(result)
+            print(f"c={level:<4} {result['throughput']:8.1f} upd/s  p50={result['p50_ms']:7.1f}ms  "
+                  f"p95={result['p95_ms']:7.1f}ms  p99={result['p99_ms']:7.1f}ms  "
+                  f"llm={result['llm_requests']:<5} api={result['bot_api_calls']:<6} errors={result['errors'] or 0}")
+    finally:
+        await driver.close()
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bot", choices=list(DRIVERS), default="ptb")
+    ap.add_argument("--storage", choices=["sql", "mongo"], default="sql",
+                    help="mongo uses MONGO_URI from the environment")
+    ap.add_argument("--concurrency", default="1,8,32", help="comma separated levels")
+    ap.add_argument("--updates", type=int, default=200, help="updates per level")
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--mix", help="kind=weight,... (ptb: text/voice/photo, aiogram: start/add)")
+    ap.add_argument("--llm-latency-ms", type=float, default=300)
+    ap.add_argument("--llm-concurrency", type=int, default=0, help="provider-side cap, 0 = none")
+    ap.add_argument("--llm-rpm", type=float, default=0, help="bot-side LLM_RPM token bucket, 0 = off")
+    ap.add_argument("--bot-api-latency-ms", type=float, default=30)
+    ap.add_argument("--out", help="write results as JSON")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="finai-loadgen-")
+    stubs = Stubs(args.bot_api_latency_ms, args.llm_latency_ms, args.llm_concurrency)
+    configure_env(args, stubs, workdir)
+    try:
+        results = asyncio.run(run(args, stubs))
+    finally:
+        stubs.close()
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
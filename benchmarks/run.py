@@ -0,0 +1,264 @@
+# benchmarks/run.py
+# Offline benchmark suite for the parsing and storage hot paths.
+#   python benchmarks/run.py                          # everything, default sizes
+#   python benchmarks/run.py --quick --out base.json  # save a baseline
+#   python benchmarks/run.py --quick --compare base.json  # exit 1 on regressions
+# Storage: db.py on a temporary SQLite file; database.py on mongomock
+# (pip install mongomock) or a real mongod with --mongo-uri. mongomock cannot
+# execute pymongo's bulk_write ops, so Mongo write paths run only on a real mongod;
+# its aggregations are pure Python, so compare Mongo numbers only run-to-run.
+import os
+import sys
+import json
+import time
+import random
+import itertools
+import shutil
+import platform
+import argparse
+import statistics
+import tempfile
+from datetime import datetime
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import datagen
+
+USERS = 5
+PAGE = 50
+
+
+def measure(fn: Callable, number: int, repeat: int = 5, budget: float = 0.2) -> Dict:
+    """
+    Median / best of `repeat` runs, per call. `number` calls per run at most:
+    slow paths are cut down so that one run takes about `budget` seconds.
+    """
+    started = time.perf_counter()
+    fn()
+    once = time.perf_counter() - started
+    number = max(1, min(number, int(budget / max(once, 1e-9))))
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - started) / number * 1e6)
+    return {"number": number, "repeat": repeat, "median_us": statistics.median(runs), "min_us": min(runs)}
+
+
+# -------------------------------
+# Parsing
+# -------------------------------
+def bench_parsing(results: Dict, number: int):
+    import ai
+    import dates
+    import utils
+
+    cycle = itertools.cycle(datagen.messages(200))
+
+    def each(fn):
+        return lambda: fn(next(cycle))
+
+    results["parse.regex_intent"] = measure(each(ai.regex_intent), number)
+    results["parse.extract_entities"] = measure(each(ai.extract_entities), number)
+    # cold: memo cleared before every call; warm: the same 200 messages again and again
+    results["parse.extract_date.cold"] = measure(each(lambda m: (dates._find.cache_clear(), ai.extract_date(m))), number)
+    results["parse.extract_date.warm"] = measure(each(ai.extract_date), number)
+
+    token = utils.TELEGRAM_BOT_TOKEN or "123456:bench-token"
+    utils.TELEGRAM_BOT_TOKEN = token
+    init_data = datagen.init_data(token, 100000)
+    results["auth.verify_telegram_init_data"] = measure(lambda: utils.verify_telegram_init_data(init_data), number)
+
+
+# -------------------------------
+# db.py (SQLite)
+# -------------------------------
+def bench_sql(results: Dict, size: int, number: int, workdir: str):
+    from sqlalchemy import insert
+    from sqlalchemy.orm import sessionmaker
+    import db
+
+    engine = db.make_engine(f"sqlite:///{os.path.join(workdir, f'bench_{size}.db')}")
+    db.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    with Session() as session, session.begin():
+        user_ids = list(session.execute(
+            insert(db.User).returning(db.User.id),
+            [{"telegram_id": u["tg_id"], "first_name": u["name"]} for u in datagen.users(USERS)],
+        ).scalars())
+        by_tg = dict(zip((u["tg_id"] for u in datagen.users(USERS)), user_ids))
+        rows = [
+            {"user_id": by_tg[tx["tg_id"]], "amount": tx["amount"], "category": tx["category"],
+             "date": datetime.fromisoformat(tx["date"]), "source": "bench"}
+            for tx in datagen.transactions(USERS, size)
+        ]
+        for i in range(0, len(rows), 5000):
+            session.execute(insert(db.Transaction), rows[i:i + 5000])
+        db.apply_rollups(session, rows)
+
+    user_id = user_ids[0]
+    session = Session()
+    middle = db.list_transactions(session, user_id, limit=size // 2)[-1]
+    prefix = f"sql.{size}."
+    results[prefix + "list_transactions.first_page"] = measure(lambda: db.list_transactions(session, user_id, limit=PAGE), number)
+    results[prefix + "list_transactions.deep_page"] = measure(
+        lambda: db.list_transactions(session, user_id, before=middle, limit=PAGE), number)
+    results[prefix + "totals_by_category"] = measure(lambda: db.totals_by_category(session, user_id), number)
+    results[prefix + "totals_by_period.month"] = measure(lambda: db.totals_by_period(session, user_id, "month"), number)
+    results[prefix + "income_vs_expense"] = measure(lambda: db.income_vs_expense(session, user_id), number)
+    results[prefix + "monthly_summary"] = measure(lambda: db.monthly_summary(session, user_id, "2025-06"), number)
+    session.close()
+
+    rng = random.Random(size)
+
+    def add_one():
+        with Session() as s, s.begin():
+            s.add(db.Transaction(user_id=user_id, amount=rng.randrange(100, 5000), category="еда",
+                                 date=datetime(2025, 6, rng.randrange(1, 29)), source="bench"))
+
+    results[prefix + "add_transaction"] = measure(add_one, max(1, number // 4))
+    engine.dispose()
+
+
+# -------------------------------
+# database.py (Mongo)
+# -------------------------------
+def bind_mongo(client, name: str):
+    """Points database.py's collections at `client[name]`."""
+    import database
+
+    database.client = client
+    database.db = client[name]
+    database.users_col = database.db["users"]
+    database.transactions_col = database.db["transactions"]
+    database.rollups_col = database.db["rollups"]
+    return database
+
+
+def bench_mongo(results: Dict, size: int, number: int, client, real: bool):
+    name = f"finance_bench_{size}"
+    client.drop_database(name)
+    database = bind_mongo(client, name)
+    database.ensure_indexes()
+    users = datagen.users(USERS)
+    database.users_col.insert_many([{"tg_id": u["tg_id"], "name": u["name"], "categories": [], "version": 0} for u in users])
+    today = datetime.now().strftime("%Y-%m-%d")
+    docs = [database.tx_doc(tx["tg_id"], tx, today) for tx in datagen.transactions(USERS, size)]
+    for i in range(0, len(docs), 5000):
+        database.transactions_col.insert_many(docs[i:i + 5000])
+    database.rebuild_rollups()
+
+    tg_id = users[0]["tg_id"]
+    middle = database.get_transactions(tg_id, limit=size // 2)[-1]
+    prefix = f"mongo.{size}."
+    results[prefix + "get_transactions.first_page"] = measure(lambda: database.get_transactions(tg_id, limit=PAGE), number)
+    results[prefix + "get_transactions.deep_page"] = measure(
+        lambda: database.get_transactions(tg_id, limit=PAGE, after=middle), number)
+    results[prefix + "totals_by_category"] = measure(lambda: database.totals_by_category(tg_id), number)
+    results[prefix + "totals_by_period.month"] = measure(lambda: database.totals_by_period(tg_id, "month"), number)
+    results[prefix + "income_vs_expense"] = measure(lambda: database.income_vs_expense(tg_id), number)
+    results[prefix + "monthly_summary"] = measure(lambda: database.monthly_summary(tg_id, "2025-06"), number)
+    if real:
+        rng = random.Random(size)
+        results[prefix + "add_transaction"] = measure(
+            lambda: database.add_transaction(tg_id, rng.randrange(100, 5000), "еда", "2025-06-15"), max(1, number // 4))
+    client.drop_database(name)
+
+
+def mongo_client(uri: str):
+    """(client, real) — a real mongod for --mongo-uri, otherwise mongomock, or (None, False)."""
+    if uri:
+        from pymongo import MongoClient
+        return MongoClient(uri), True
+    try:
+        import mongomock
+    except ImportError:
+        return None, False
+    return mongomock.MongoClient(), False
+
+
+# -------------------------------
+# Report / compare
+# -------------------------------
+def print_table(results: Dict, baseline: Dict = None):
+    width = max(len(k) for k in results)
+    for key, r in results.items():
+        line = f"{key:{width}}  {r['median_us']:12.1f} us"
+        if baseline and key in baseline:
+            line += f"  {r['median_us'] / baseline[key]['median_us'] - 1:+8.1%}"
+        print(line)
+
+
+def regressions(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    return [
+        f"{key}: {baseline[key]['median_us']:.1f} -> {r['median_us']:.1f} us"
+        for key, r in results.items()
+        if key in baseline and r["median_us"] > baseline[key]["median_us"] * (1 + threshold)
+    ]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--quick", action="store_true", help="smaller sizes and fewer iterations")
+    ap.add_argument("--sizes", default=None, help="transactions per user, comma separated (default 100,1000,10000)")
+    ap.add_argument("--only", choices=["parse", "sql", "mongo"], action="append")
+    ap.add_argument("--mongo-uri", default=os.getenv("BENCH_MONGO_URI"))
+    ap.add_argument("--out", help="write results as JSON")
+    ap.add_argument("--compare", help="baseline JSON from a previous --out")
+    ap.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown vs baseline (0.2 = 20%%)")
+    args = ap.parse_args()
+
+    sizes = [int(s) for s in (args.sizes or ("100,1000" if args.quick else "100,1000,10000")).split(",")]
+    number = 200 if args.quick else 1000
+    groups = args.only or ["parse", "sql", "mongo"]
+    results = {}
+
+    if "parse" in groups:
+        bench_parsing(results, number * 5)
+    if "sql" in groups:
+        workdir = tempfile.mkdtemp(prefix="finai-bench-")
+        try:
+            for size in sizes:
+                bench_sql(results, size, number // 5, workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if "mongo" in groups:
+        client, real = mongo_client(args.mongo_uri)
+        if client is None:
+            print("mongo: skipped (no --mongo-uri and mongomock is not installed)", file=sys.stderr)
+        else:
+            for size in sizes:
+                bench_mongo(results, size, number // 10, client, real)
+
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": args.quick,
+            "sizes": sizes,
+            "mongo": "mongod" if args.mongo_uri else "mongomock",
+        },
+        "results": results,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print_table(results, baseline)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if baseline is not None:
+        slow = regressions(results, baseline, args.threshold)
+        if slow:
+            print(f"\n{len(slow)} regression(s) over {args.threshold:.0%}:")
+            for line in slow:
+                print("  " + line)
+            sys.exit(1)
+        print(f"\nno regressions over {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# benchmarks/stub_llm.py
+# Local OpenAI-compatible chat completions server for offline runs.
+# Answers with what ai.regex_parse extracts: one JSON object per request, or
+# a JSON array when the user message is a JSON array (llm_batch prompt);
+# "stream": true gets the same content as SSE chunks.
+#   python benchmarks/stub_llm.py --port 8089 --latency-ms 300
+#   OPENROUTER_API_URL=http://127.0.0.1:8089/v1/chat/completions python bot.py
+import os
+import sys
+import json
+import random
+import asyncio
+import argparse
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import ai
+
+
+def answer(text: str) -> dict:
+    parsed = ai.regex_parse(text)
+    return {
+        "intent": parsed["intent"] or "добавить_трату",
+        "amount": parsed["amount"],
+        "category": parsed["category"],
+        "date": parsed["date"].date().isoformat() if parsed["date"] else None,
+    }
+
+
+def make_app(latency_ms: float = 200, concurrency: int = 0, bad_item_rate: float = 0.0,
+             stream_delay_ms: float = 20) -> web.Application:
+    """
+    latency_ms — fixed service time per request (time to first token when
+    streaming); concurrency > 0 caps requests served at once (a provider rate
+    limit); bad_item_rate — share of batch items replaced with garbage to
+    exercise the per-item fallback; stream_delay_ms — pause between SSE chunks.
+    """
+    app = web.Application()
+    app["stats"] = {"requests": 0, "items": 0}
+    slots = asyncio.Semaphore(concurrency) if concurrency > 0 else None
+
+    async def completions(request: web.Request) -> web.Response:
+        body = await request.json()
+        user = next((m["content"] for m in reversed(body["messages"]) if m["role"] == "user"), "")
+        try:
+            texts = json.loads(user)
+        except ValueError:
+            texts = None
+        if isinstance(texts, list):
+            items = [
+                {"i": i, "oops": True} if random.random() < bad_item_rate else dict(answer(t), i=i)
+                for i, t in enumerate(texts)
+            ]
+            content = json.dumps(items, ensure_ascii=False)
+        else:
+            items = [None]
+            content = json.dumps(answer(user), ensure_ascii=False)
+
+        if slots is not None:
+            async with slots:
+                await asyncio.sleep(latency_ms / 1000)
+        else:
+            await asyncio.sleep(latency_ms / 1000)
+        app["stats"]["requests"] += 1
+        app["stats"]["items"] += len(items)
+        if body.get("stream"):
+            return await stream(request, content)
+        return web.json_response({
+            "id": f"stub-{app['stats']['requests']}",
+            "object": "chat.completion",
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+        })
+
+    async def stream(request: web.Request, content: str) -> web.StreamResponse:
+        """SSE chunks of a few characters, like a real provider's token stream."""
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        await resp.write(b": OPENROUTER PROCESSING\n\n")
+        for i in range(0, len(content), 8):
+            chunk = {"choices": [{"index": 0, "delta": {"content": content[i:i + 8]}}]}
+            await resp.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            await asyncio.sleep(stream_delay_ms / 1000)
+        await resp.write(b"data: [DONE]\n\n")
+        await resp.write_eof()
+        return resp
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response(app["stats"])
+
+    app.router.add_post("/v1/chat/completions", completions)
+    app.router.add_post("/chat/completions", completions)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+async def start(host: str = "127.0.0.1", port: int = 0, **options) -> tuple:
+    """Runs the stub inside the current event loop; returns (runner, base url)."""
+    app = make_app(**options)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}/v1/chat/completions"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency-ms", type=float, default=200)
+    ap.add_argument("--concurrency", type=int, default=0)
+    ap.add_argument("--bad-item-rate", type=float, default=0.0)
+    ap.add_argument("--stream-delay-ms", type=float, default=20)
+    args = ap.parse_args()
+    web.run_app(
+        make_app(args.latency_ms, args.concurrency, args.bad_item_rate, args.stream_delay_ms),
+        host=args.host, port=args.port,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# benchmarks/test_dates.py
+# Date forms dates.py must and must not read as dates:
+#   python -m pytest benchmarks/test_dates.py
+import os
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import dates
+
+REF = date(2024, 11, 20)
+
+
+@pytest.mark.parametrize("text", ["кофе 7.10", "3.50", "такси 12.5", "обед 3,50", "бензин 45.99 на заправке"])
+def test_decimal_amounts_are_not_dates(text):
+    assert dates.find_date(text, REF) is None
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("с 15.02 по сегодня", date(2024, 2, 15)),
+    ("траты до 1.03", date(2024, 3, 1)),
+    ("кофе на 7.10", date(2024, 10, 7)),
+    ("обед 15.02.24 в кафе", date(2024, 2, 15)),
+    ("обед 7.10.2023", date(2023, 10, 7)),
+    ("с 15.02.2023", date(2023, 2, 15)),
+])
+def test_day_month_dates(text, expected):
+    assert dates.find_date(text, REF)[0] == expected
+
+
+def test_preposition_stays_outside_the_span():
+    text = "кофе на 7.10 250"
+    _, (start, end) = dates.find_date(text, REF)
+    assert text[start:end] == "7.10"
+
+
+def test_money_after_preposition_is_not_a_date():
+    assert dates.find_date("купил на 12.50 руб", REF) is None
@@ -0,0 +1,48 @@
+# benchmarks/test_importtime.py
+# The cold-start rules of importtime.py as a pytest check:
+#   python -m pytest benchmarks/test_importtime.py
+# Lazy-import rules are machine independent and always enforced. Budgets are
+# wall-clock, so slower CI machines can scale them: IMPORTTIME_BUDGET_SCALE=2.
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+import importtime
+
+BUDGET_SCALE = float(os.getenv("IMPORTTIME_BUDGET_SCALE", "1"))
+
+
+@pytest.fixture(scope="module", params=list(importtime.TARGETS))
+def report(request):
+    try:
+        return request.param, importtime.measure(request.param, repeat=1)
+    except RuntimeError as e:
+        if "ModuleNotFoundError" in str(e):
+            pytest.skip(f"{request.param}: dependencies not installed")
+        raise
+
+
+def test_no_eager_imports(report):
+    name, r = report
+    assert r["eager"] == [], f"{name} imports at startup what should load on first use: {r['eager']}"
+
+
+def test_within_budget(report):
+    name, r = report
+    budget = importtime.BUDGET_MS[name] * BUDGET_SCALE
+    assert r["median_ms"] <= budget, f"{name}: {r['median_ms']:.0f} ms > budget {budget:.0f} ms"
+
+
+def test_available_checks_do_not_import():
+    # asr.available / ocr.available run on the event loop in the handlers
+    code = (
+        "import sys, json, asr, ocr\n"
+        "asr.available(); ocr.available()\n"
+        "print(json.dumps(sorted(m for m in ('vosk', 'soundfile', 'numpy', 'pytesseract', 'PIL') if m in sys.modules)))\n"
+    )
+    proc = subprocess.run([sys.executable, "-c", code], cwd=importtime.ROOT, capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr
+    assert json.loads(proc.stdout.strip().splitlines()[-1]) == []
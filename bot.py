@@ -1,6 +1,8 @@
 import os
-import io
 import json
+import math
+import time
+import asyncio
 import logging
 from datetime import datetime
 from dotenv import load_dotenv
@@ -11,8 +13,11 @@ from telegram import (
     InlineKeyboardButton,
     WebAppInfo,
 )
+from telegram.error import RetryAfter
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     ApplicationBuilder,
+    BaseUpdateProcessor,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
@@ -21,18 +26,27 @@ from telegram.ext import (
 )
 
 # Audio
-from pydub import AudioSegment
+import asr
 
 # OCR
-from PIL import Image
-import pytesseract
+import ocr
 
 # AI
-import openai
+import ai
+from ai import AsyncOpenRouterClient, aclose_http
+import llm_cache
+from llm_batch import BatchExtractor, LLM_BATCH_MS, LLM_BATCH_SIZE
+from matcher import vocabularies
 
 # DB
-from sqlalchemy import create_engine, Column, Integer, String, Float, Date, ForeignKey
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from storage import get_storage, WriteBehindQueue
+
+# Scheduler
+from scheduler import scheduler, QueueFull
+import metrics
+import tracing
+from profiling import profiler, install_signal_handlers, PROFILE_SECONDS, MODES as PROFILE_MODES
+import updates
 
 
 # ============================================================
@@ -45,8 +59,12 @@ BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 SECRET_KEY = os.getenv("SECRET_KEY").encode()
 
-openai.api_key = OPENROUTER_API_KEY
-openai.api_base = "https://openrouter.ai/api/v1"
+# Общий для процесса пул соединений к OpenRouter (см. ai.py)
+llm = AsyncOpenRouterClient(
+    api_url=os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions"),
+    api_key=OPENROUTER_API_KEY,
+    model="qwen/qwen-2-7b-instruct",
+)
 
 # Mini App URL
 WEBAPP_URL = "https://finai-app-v0.streamlit.app/"
@@ -61,144 +79,243 @@ logging.basicConfig(
 # 📦 DATABASE
 # ============================================================
 
-Base = declarative_base()
-engine = create_engine("sqlite:///database.db")
-SessionLocal = sessionmaker(bind=engine)
+# Асинхронное хранилище (storage.py): STORAGE_BACKEND=sql|mongo
+storage = get_storage()
 
+# WRITE_BEHIND_MS > 0 включает отложенную пакетную запись
+WRITE_BEHIND_MS = int(os.getenv("WRITE_BEHIND_MS", "0"))
+write_behind = WriteBehindQueue(storage, WRITE_BEHIND_MS / 1000) if WRITE_BEHIND_MS > 0 else None
 
-class User(Base):
-    __tablename__ = "users"
 
-    id = Column(Integer, primary_key=True)
-    tg_id = Column(String, unique=True)
-    name = Column(String)
+# ============================================================
+# ⏳ SCHEDULER: лимиты на LLM / OCR / ASR
+# ============================================================
 
-    transactions = relationship("Transaction", back_populates="user")
-    categories = relationship("Category", back_populates="user")
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Апдейты разных пользователей — параллельно (до BOT_CONCURRENT_UPDATES),
+    одного пользователя — строго по очереди (updates.ordering). Семафор PTB
+    ограничивает только число принятых апдейтов (BOT_PENDING_UPDATES).
+    """
 
+    async def do_process_update(self, update, coroutine):
+        key = None
+        if isinstance(update, Update):
+            who = update.effective_user or update.effective_chat
+            key = who.id if who else None
+        async with updates.ordering.slot(key):
+            await coroutine
 
-class Category(Base):
-    __tablename__ = "categories"
+    async def initialize(self):
+        pass
 
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    name = Column(String)
+    async def shutdown(self):
+        # Application.stop() уже дождался апдейтов; здесь — на случай остановки без stop()
+        await updates.ordering.drain()
 
-    user = relationship("User", back_populates="categories")
-    transactions = relationship("Transaction", back_populates="category")
 
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest с замером каждого вызова Bot API: метрики и спаны трейса (download, sendMessage, ...)."""
 
-class Transaction(Base):
-    __tablename__ = "transactions"
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        name = "download" if "/file/bot" in url else url.rsplit("/", 1)[-1]
+        with metrics.timed(metrics.TELEGRAM_SECONDS, method=name):
+            return await super().do_request(url, method, *args, **kwargs)
 
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    category_id = Column(Integer, ForeignKey("categories.id"))
-    amount = Column(Float)
-    date = Column(Date)
 
-    user = relationship("User", back_populates="transactions")
-    category = relationship("Category", back_populates="transactions")
+def busy_notice(message):
+    """on_queued для scheduler.slot: сразу говорим, что запрос в очереди."""
+    if message is None:
+        return None
 
+    async def notify(position: int):
+        await message.reply_text(f"⏳ Сейчас много запросов, вы в очереди ({position}). Ответ придёт чуть позже.")
 
-Base.metadata.create_all(engine)
+    return notify
 
 
 # ============================================================
 # 🧠 AI LOGIC: Intent + Entity Extraction
 # ============================================================
 
-async def ai_parse_text(prompt: str):
+PARSE_SYSTEM_PROMPT = (
+    "Ты — финансовый ассистент. Задача: извлечь данные о транзакциях.\n"
+    "Отвечай строго в JSON:\n"
+    "{intent: 'добавить_трату' | 'показать_аналитику' | 'дать_совет',\n"
+    " amount: число | null,\n"
+    " category: строка | null,\n"
+    " date: ISO8601 | null}\n"
+)
+# Меняется вместе с PARSE_SYSTEM_PROMPT: входит в ключ кэша LLM
+PARSE_PROMPT_VERSION = "bot-parse:1"
+
+# LLM_BATCH_MS > 0: сообщения, пришедшие в пределах окна, разбираются одним запросом к LLM;
+# слот и токен квоты scheduler берутся один раз на запрос пачки, а не на каждое сообщение
+batcher = BatchExtractor(
+    llm, LLM_BATCH_MS / 1000, LLM_BATCH_SIZE, slot=lambda: scheduler.slot("llm", "batch"),
+) if LLM_BATCH_MS > 0 else None
+
+
+async def ai_parse_text(prompt: str, tg_id: int = 0, message=None):
     """
     Вызывает OpenRouter LLM и получает JSON с intent/суммой/категорией/датой.
+    Разобранные ответы кэшируются (llm_cache.py) по нормализованному тексту;
+    попадание в кэш не ждёт очереди scheduler, запрос к LLM — ждёт
+    (message — куда ответить "в очереди").
     """
+    cache_key = llm_cache.make_key(prompt, llm.model, PARSE_PROMPT_VERSION)
+    data = await llm_cache.cache.aget(cache_key)
+    if data is not None:
+        return data
+    if batcher is not None:
+        data = await batcher.extract(prompt)
+        # разобранные регулярками элементы не кэшируем: в следующий раз спросим LLM
+        if not data.pop("fallback", False):
+            await llm_cache.cache.aset(cache_key, data)
+        return data
     try:
-        response = await openai.ChatCompletion.acreate(
-            model="qwen/qwen-2-7b-instruct",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "Ты — финансовый ассистент. Задача: извлечь данные о транзакциях.\n"
-                        "Отвечай строго в JSON:\n"
-                        "{intent: 'добавить_трату' | 'показать_аналитику' | 'дать_совет',\n"
-                        " amount: число | null,\n"
-                        " category: строка | null,\n"
-                        " date: ISO8601 | null}\n"
-                    )
-                },
-                {"role": "user", "content": prompt},
-            ]
-        )
-
-        text = response["choices"][0]["message"]["content"]
+        async with scheduler.slot("llm", tg_id, on_queued=busy_notice(message)):
+            text = await llm.chat(
+                [
+                    {"role": "system", "content": PARSE_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt},
+                ]
+            )
         data = json.loads(text)
+        await llm_cache.cache.aset(cache_key, data)
         return data
 
+    except QueueFull:
+        raise
     except Exception as e:
         logging.error(f"AI error: {e}")
         return {"intent": "unknown"}
 
 
+ADVICE_SYSTEM_PROMPT = (
+    "Ты — финансовый ассистент. Дай короткий практичный совет по запросу "
+    "пользователя: 3–5 пунктов, без вступлений."
+)
+# Лимит длины сообщения Telegram
+TELEGRAM_MAX_TEXT = 4096
+
+
+async def stream_advice(message, text: str, tg_id: int):
+    """
+    Совет стримится из LLM (SSE): сразу отправляем заглушку и дописываем
+    её по мере генерации, с троттлингом правок (ProgressiveReply).
+    """
+    reply = ProgressiveReply(message)
+    await reply.start("💡 Думаю…")
+    advice = ""
+    try:
+        async with scheduler.slot("llm", tg_id, on_queued=busy_notice(message)), \
+                metrics.timed(metrics.LLM_SECONDS, call="stream"):
+            async for piece in llm.chat_stream(
+                [
+                    {"role": "system", "content": ADVICE_SYSTEM_PROMPT},
+                    {"role": "user", "content": text},
+                ],
+                max_tokens=400,
+            ):
+                advice += piece
+                reply.update(("💡 Совет:\n" + advice + " ▌")[:TELEGRAM_MAX_TEXT])
+    except QueueFull:
+        await reply.finish("⏳ Слишком много запросов, попробуйте через минуту.")
+        return
+    except Exception as e:
+        logging.error(f"AI advice error: {e}")
+        if not advice:
+            await reply.finish("Не удалось получить совет, попробуйте позже.")
+            return
+    await reply.finish(("💡 Совет:\n" + advice.strip())[:TELEGRAM_MAX_TEXT])
+
+
 # ============================================================
 # 🔊 AUDIO → TEXT
 # ============================================================
 
-def transcribe_voice(file_bytes: bytes) -> str:
+async def transcribe_voice(file_bytes: bytes, on_partial=None) -> str:
     """
-    Оффлайн транскрибация голосовых сообщений с помощью pydub + whisper.cpp (или любая локальная модель)
-    Здесь для примера — просто заглушка.
+    Оффлайн транскрибация голосовых сообщений (Vosk, см. asr.py): OGG/Opus
+    из Telegram декодируется в памяти, модель загружена один раз на процесс.
+    on_partial получает промежуточный текст по мере распознавания.
     """
-    # TODO: Вставить reallocal ASR
-    return "голосовая транскрибация не настроена"
+    return await asr.engine.transcribe_async(file_bytes, on_partial)
 
 
-# ============================================================
-# 🖼️ OCR
-# ============================================================
+class ProgressiveReply:
+    """
+    Сообщение-заглушка, которое редактируется по мере появления текста,
+    не чаще раза в interval секунд (лимиты Telegram на editMessageText).
+    """
 
-def extract_text_from_image(img_bytes: bytes) -> str:
-    img = Image.open(io.BytesIO(img_bytes))
-    return pytesseract.image_to_string(img, lang="rus+eng")
+    def __init__(self, message, interval: float = 1.0):
+        self.message = message
+        self.interval = interval
+        self._sent = None
+        self._shown = ""
+        self._latest = ""
+        self._task = None
+        self._last_edit = 0.0
+
+    async def start(self, text: str):
+        # _last_edit не трогаем: первое обновление уходит сразу, дальше — с интервалом
+        self._sent = await self.message.reply_text(text)
+        self._shown = text
+
+    def update(self, text: str):
+        self._latest = text
+        if self._task is None and self._sent is not None:
+            self._task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(max(0.0, self._last_edit + self.interval - loop.time()))
+        self._task = None
+        await self._edit(self._latest)
+
+    async def _edit(self, text: str):
+        if not text or text == self._shown:
+            return
+        delay = 0.0
+        try:
+            await self._sent.edit_text(text)
+            self._shown = text
+        except RetryAfter as e:
+            # Telegram просит подождать: следующую правку откладываем
+            delay = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+            logging.warning(f"edit_text rate limited for {delay}s")
+        except Exception as e:
+            logging.warning(f"edit_text failed: {e}")
+        self._last_edit = asyncio.get_running_loop().time() + delay
+
+    async def finish(self, text: str):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self._edit(text)
 
 
 # ============================================================
 # 🗄️ SAVE TO DATABASE
 # ============================================================
 
-def add_transaction(tg_id: str, amount: float, category_name: str, date_str: str):
-    session = SessionLocal()
-
-    user = session.query(User).filter_by(tg_id=tg_id).first()
-    if not user:
-        return None
-
-    # Ensure category exists
-    category = session.query(Category).filter_by(user_id=user.id, name=category_name).first()
-    if not category:
-        category = Category(user_id=user.id, name=category_name)
-        session.add(category)
-        session.commit()
-
-    dt = datetime.fromisoformat(date_str).date()
-
-    tx = Transaction(
-        user_id=user.id,
-        category_id=category.id,
-        amount=amount,
-        date=dt
-    )
-    session.add(tx)
-    session.commit()
-    return tx
+async def save_transaction(tg_id: int, amount: float, category_name: str, date_str: str):
+    if write_behind is not None:
+        return await write_behind.add_transaction(tg_id, amount, category_name, date_str)
+    return await storage.add_transaction(tg_id, amount, category_name, date_str)
 
 
 # ============================================================
 # 🔘 MINI APP BUTTON
 # ============================================================
 
+@metrics.timed(metrics.HANDLER_SECONDS)
+@tracing.root
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
+    await storage.create_user(user.id, user.first_name)
 
     keyboard = [
         [
@@ -219,29 +336,78 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # 📩 MAIN MESSAGE HANDLER
 # ============================================================
 
+async def user_vocabulary(tg_id: int):
+    """Ключевые слова + категории пользователя; автомат кэшируется в matcher.vocabularies."""
+    vocab = vocabularies.get(tg_id)
+    if vocab is None:
+        names = [c["name"] for c in await storage.get_categories(tg_id)]
+        vocab = vocabularies.put(tg_id, ai.build_vocabulary(names))
+    return vocab
+
+
+@metrics.timed(metrics.STAGE_SECONDS, stage="parse")
+async def parse_text(text: str, tg_id: int = None, message=None) -> dict:
+    """
+    Сначала регулярки (ai.regex_parse, доли миллисекунды); LLM — только
+    если уверенность в интенте/сумме/категории ниже порога (ai_parse_text).
+    """
+    started = time.perf_counter()
+    vocab = await user_vocabulary(tg_id) if tg_id is not None else None
+    data = ai.regex_parse(text, vocab)
+    tier = "regex"
+    if not ai.is_confident(data):
+        data = await ai_parse_text(text, tg_id or 0, message)
+        tier = "llm"
+    tracing.annotate(tier=tier)
+    logging.info(f"[PARSE] tier={tier} {(time.perf_counter() - started) * 1000:.1f}ms")
+    return data
+
+
+def parse_amount(value):
+    """Сумма из ответа парсера как число; None, если её нет или это не число."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        try:
+            value = float(str(value).replace(",", "."))
+        except ValueError:
+            return None
+    return value if math.isfinite(value) else None
+
+
+@metrics.timed(metrics.HANDLER_SECONDS)
+@tracing.root
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await process_text(update, context, update.message.text)
+
+
+async def process_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    """
+    Разбор и ответ на текст сообщения. Голос/фото вызывают его с распознанным
+    текстом (Message в PTB неизменяем) и не замеряются повторно как handle_message.
+    """
     user = update.effective_user
-    text = update.message.text
 
     logging.info(f"[TEXT] {user.id}: {text}")
 
-    data = await ai_parse_text(text)
+    data = await parse_text(text, user.id, update.message)
 
     intent = data.get("intent")
 
     if intent == "добавить_трату":
-        amount = data.get("amount")
+        amount = parse_amount(data.get("amount"))
+        if amount is None:
+            await update.message.reply_text("Не понял сумму. Напишите, сколько потратили, например: «кофе 250».")
+            return
         cat = data.get("category")
-        dt = data.get("date", datetime.now().date().isoformat())
+        dt = data.get("date") or datetime.now().date().isoformat()
 
-        tx = add_transaction(str(user.id), amount, cat, dt)
+        tx = await save_transaction(user.id, amount, cat, dt)
 
         if tx:
             await update.message.reply_text(
                 f"🧾 Транзакция добавлена!\n"
                 f"💸 {amount} ₽\n"
-                f"📂 Категория: {cat}\n"
-                f"📅 Дата: {tx.date}"
+                f"📂 Категория: {tx['category']}\n"
+                f"📅 Дата: {tx['date']}"
             )
         else:
             await update.message.reply_text("Ошибка при сохранении транзакции.")
@@ -250,9 +416,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("📊 Аналитика доступна в Mini App.\nОткрой через кнопку /start")
 
     elif intent == "дать_совет":
-        # Второй вызов LLM для генерации совета
-        advice = await ai_parse_text(f"Дай финансовый совет на основе запроса: {text}")
-        await update.message.reply_text("💡 Совет:\n" + str(advice))
+        await stream_advice(update.message, text, user.id)
 
     else:
         await update.message.reply_text("Не понял запрос. Попробуйте уточнить.")
@@ -262,47 +426,153 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # 🔉 VOICE HANDLER
 # ============================================================
 
+@metrics.timed(metrics.HANDLER_SECONDS)
+@tracing.root
 async def handle_voice(update: Update, context):
     user = update.effective_user
+    if not asr.available():
+        await update.message.reply_text("🎤 Распознавание голоса сейчас недоступно, напишите текстом.")
+        return
 
     file = await update.message.voice.get_file()
     file_bytes = await file.download_as_bytearray()
 
-    text = transcribe_voice(file_bytes)
-    await update.message.reply_text(f"🎤 Распознано: {text}")
-    update.message.text = text
+    reply = ProgressiveReply(update.message)
+    await reply.start("🎤 Распознаю…")
+    try:
+        async with scheduler.slot("asr", user.id, on_queued=busy_notice(update.message)):
+            text = await transcribe_voice(bytes(file_bytes), lambda partial: reply.update(f"🎤 {partial}…"))
+    except QueueFull:
+        await reply.finish("⏳ Слишком много запросов, попробуйте через минуту.")
+        return
+    except Exception as e:
+        logging.error(f"ASR error: {e}")
+        await reply.finish("🎤 Не удалось распознать голосовое, напишите текстом.")
+        return
+    await reply.finish(f"🎤 Распознано: {text}")
 
-    return await handle_message(update, context)
+    return await process_text(update, context, text)
 
 
 # ============================================================
 # 🖼️ PHOTO HANDLER
 # ============================================================
 
+@metrics.timed(metrics.HANDLER_SECONDS)
+@tracing.root
 async def handle_photo(update: Update, context):
-    file = await update.message.photo[-1].get_file()
+    if not ocr.available():
+        await update.message.reply_text("📷 Распознавание чеков сейчас недоступно, напишите сумму текстом.")
+        return
+    photo = update.message.photo[-1]
+    file = await photo.get_file()
     file_bytes = await file.download_as_bytearray()
-    text = extract_text_from_image(file_bytes)
+    # file_unique_id одинаков у пересланных и повторно отправленных фото
+    async with scheduler.slot("ocr", update.effective_user.id, on_queued=busy_notice(update.message)):
+        text = await ocr.engine.recognize(bytes(file_bytes), key=photo.file_unique_id)
 
     await update.message.reply_text(f"📷 Текст на изображении:\n{text}")
-    update.message.text = text
-    return await handle_message(update, context)
+    return await process_text(update, context, text)
+
+
+# ============================================================
+# 🩺 PROFILING (только для админов)
+# ============================================================
+
+# Telegram id через запятую, кому доступна /profile
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()}
+
+
+async def run_profile(message, seconds: float, mode: str):
+    try:
+        path = await profiler.run(seconds, mode)
+    except Exception as e:
+        await message.reply_text(f"Профилирование не удалось: {e}")
+        return
+    with open(path, "rb") as f:
+        await message.reply_document(f, filename=os.path.basename(path))
+
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /profile [cpu|mem] [секунды] — cProfile или tracemalloc на время окна,
+    отчёт приходит файлом. Остальные апдейты обрабатываются как обычно.
+    """
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    args = context.args or []
+    mode = next((a for a in args if a in PROFILE_MODES), "cpu")
+    try:
+        seconds = next((float(a) for a in args if a not in PROFILE_MODES), PROFILE_SECONDS)
+    except ValueError:
+        await update.message.reply_text("Используй: /profile [cpu|mem] [секунды]")
+        return
+    if profiler.running:
+        await update.message.reply_text(f"Уже идёт профилирование ({profiler.running}).")
+        return
+    await update.message.reply_text(f"⏱ Профилирую {mode} {seconds:.0f} с…")
+    context.application.create_task(run_profile(update.message, seconds, mode), update=update)
 
 
 # ============================================================
 # 🚀 MAIN
 # ============================================================
 
+async def on_error(update, context: ContextTypes.DEFAULT_TYPE):
+    if isinstance(context.error, QueueFull) and isinstance(update, Update) and update.effective_message:
+        await update.effective_message.reply_text("⏳ Слишком много запросов, попробуйте через минуту.")
+        return
+    logging.error("Update handling failed", exc_info=context.error)
+
+
+async def on_startup(app):
+    await storage.ensure_indexes()
+    app.bot_data["metrics_runner"] = await metrics.start_server()
+    install_signal_handlers()
+
+
+async def on_shutdown(app):
+    if batcher is not None:
+        await batcher.close()
+    if write_behind is not None:
+        await write_behind.close()
+    await storage.close()
+    await aclose_http()
+    ocr.engine.shutdown()
+    if app.bot_data.get("metrics_runner") is not None:
+        await app.bot_data["metrics_runner"].cleanup()
+
+
 def main():
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    app = (
+        ApplicationBuilder().token(BOT_TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor(updates.BOT_PENDING_UPDATES))
+        .request(InstrumentedRequest())
+        .post_init(on_startup).post_shutdown(on_shutdown)
+        .build()
+    )
 
     app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("profile", profile_command))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     app.add_handler(MessageHandler(filters.VOICE, handle_voice))
     app.add_handler(MessageHandler(filters.PHOTO, handle_photo))
-
-    logging.info("Bot started.")
-    app.run_polling()
+    app.add_error_handler(on_error)
+
+    # Остановка (SIGINT/SIGTERM): приём апдейтов прекращается, принятые
+    # дорабатываются (Application.stop), затем on_shutdown закрывает ресурсы
+    logging.info(f"Bot started ({updates.BOT_MODE}).")
+    if updates.BOT_MODE == "webhook":
+        app.run_webhook(
+            listen=updates.WEBHOOK_LISTEN,
+            port=updates.WEBHOOK_PORT,
+            url_path=updates.WEBHOOK_PATH.lstrip("/"),
+            webhook_url=updates.webhook_url(),
+            secret_token=updates.webhook_secret(),
+            max_connections=updates.WEBHOOK_MAX_CONNECTIONS,
+        )
+    else:
+        app.run_polling()
 
 
 if __name__ == "__main__":
@@ -4,8 +4,14 @@ import os
 from aiogram import Bot, Dispatcher, types
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
 from aiogram.filters import Command
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 from dotenv import load_dotenv
-from database import create_user, add_transaction, get_transactions
+from storage import get_storage
+import metrics
+import tracing
+from profiling import install_signal_handlers
+import updates
 
 load_dotenv()
 API_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
@@ -13,6 +19,17 @@ SECRET_KEY = os.getenv("SECRET_KEY").encode()
 
 bot = Bot(token=API_TOKEN)
 dp = Dispatcher()
+storage = get_storage(os.getenv("STORAGE_BACKEND", "mongo"))
+
+
+# Апдейты разных пользователей — параллельно (до BOT_CONCURRENT_UPDATES),
+# одного пользователя — строго по очереди. event_from_user заполняет
+# UserContextMiddleware, которую Dispatcher регистрирует первой.
+@dp.update.outer_middleware()
+async def per_user_order(handler, event, data):
+    who = data.get("event_from_user") or data.get("event_chat")
+    async with updates.ordering.slot(who.id if who else None):
+        return await handler(event, data)
 
 
 def generate_signature(user_id: int) -> str:
@@ -21,9 +38,11 @@ def generate_signature(user_id: int) -> str:
 
 
 @dp.message(Command(commands=["start"]))
+@metrics.timed(metrics.HANDLER_SECONDS)
+@tracing.root
 async def start(msg: types.Message):
     user = msg.from_user
-    create_user(user.id, user.first_name)
+    await storage.create_user(user.id, user.first_name)
 
     signature = generate_signature(user.id)
 
@@ -39,30 +58,83 @@ async def start(msg: types.Message):
     await msg.answer("Открывай Mini App 👇", reply_markup=kb)
 
 
-# Пример команды добавления транзакции через бот
+# Пример команды добавления транзакции через бот.
+# Несколько пар за раз: /add 250 кофе 1200 такси
 @dp.message(Command(commands=["add"]))
+@metrics.timed(metrics.HANDLER_SECONDS)
+@tracing.root
 async def add(msg: types.Message):
-    parts = msg.text.split()
-    if len(parts) != 3:
-        await msg.answer("Используй: /add сумма категория")
+    parts = msg.text.split()[1:]
+    if not parts or len(parts) % 2:
+        await msg.answer("Используй: /add сумма категория [сумма категория ...]")
         return
 
-    _, amount_str, category = parts
-    try:
-        amount = float(amount_str)
-    except:
-        await msg.answer("Сумма должна быть числом")
+    items = []
+    for amount_str, category in zip(parts[::2], parts[1::2]):
+        try:
+            amount = float(amount_str)
+        except:
+            await msg.answer("Сумма должна быть числом")
+            return
+        items.append({"amount": amount, "category": category})
+
+    if len(items) == 1:
+        tx = await storage.add_transaction(msg.from_user.id, items[0]["amount"], items[0]["category"])
+        await msg.answer(f"Добавлена транзакция: {tx['amount']} ₽ в {tx['category']}")
         return
 
-    tx = add_transaction(msg.from_user.id, amount, category)
-    await msg.answer(f"Добавлена транзакция: {tx['amount']} ₽ в {tx['category']}")
+    txs = await storage.add_transactions(msg.from_user.id, items)
+    lines = [f"{tx['amount']} ₽ в {tx['category']}" for tx in txs]
+    await msg.answer(f"Добавлено транзакций: {len(txs)}\n" + "\n".join(lines))
+
+
+@dp.startup()
+async def on_startup(bot: Bot):
+    await storage.ensure_indexes()
+    dp["metrics_runner"] = await metrics.start_server()
+    install_signal_handlers()  # kill -USR1 / -USR2: профиль CPU / памяти
+    if updates.BOT_MODE == "webhook":
+        await bot.set_webhook(
+            updates.webhook_url(),
+            secret_token=updates.webhook_secret(),
+            max_connections=updates.WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+    else:
+        await bot.delete_webhook()  # getUpdates не работает, пока установлен вебхук
+
+
+# Вызывается и после polling, и при остановке веб-сервера — до закрытия
+# сессии бота: приём уже остановлен, принятые апдейты дорабатываются.
+@dp.shutdown()
+async def on_shutdown():
+    await updates.ordering.drain()
+    await storage.close()
+    if dp.get("metrics_runner") is not None:
+        await dp["metrics_runner"].cleanup()
+
+
+def webhook_app() -> web.Application:
+    app = web.Application()
+    # Порядок важен: shutdown диспетчера (drain) раньше, чем обработчик закроет сессию бота
+    setup_application(app, dp, bot=bot)
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=updates.webhook_secret(), handle_in_background=True,
+    ).register(app, path=updates.WEBHOOK_PATH)
+    return app
 
 
 async def main():
     print("Bot started...")
-    await dp.start_polling(bot)
+    # tasks_concurrency_limit ограничивает принятые апдейты, одновременную
+    # обработку — per_user_order
+    await dp.start_polling(bot, tasks_concurrency_limit=updates.BOT_PENDING_UPDATES)
 
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(main())
+    if updates.BOT_MODE == "webhook":
+        print("Bot started (webhook)...")
+        web.run_app(webhook_app(), host=updates.WEBHOOK_LISTEN, port=updates.WEBHOOK_PORT)
+    else:
+        import asyncio
+        asyncio.run(main())
@@ -1,54 +1,95 @@
-from pymongo import MongoClient
-from bson.objectid import ObjectId
-from dotenv import load_dotenv
-import os
+from pymongo import MongoClient, ReplaceOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError, InvalidOperation
+import logging
 from datetime import datetime
-
-load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI")
+from matcher import vocabularies
+import metrics
+# Схема и построители запросов (общие с storage_mongo) — в mongo_schema
+from mongo_schema import (
+    MONGO_URI, DB_NAME, USER_PROJECTION, TX_PROJECTION, TX_SORT, INCOME_CATEGORIES, DEFAULT_CATEGORY, INDEXES,
+    date_str, profile, user_upsert, version_bump, category_push, tx_doc, transaction_writes,
+    writes_by_collection, tx_filter, tx_page_filter, rollup_ops,
+)
 
 client = MongoClient(MONGO_URI)
-db = client["finance_app"]
+db = client[DB_NAME]
 users_col = db["users"]
+transactions_col = db["transactions"]
+# Нарастающие суммы по (tg_id, month, category), см. rollup_ops
+rollups_col = db["rollups"]
+
+# Время каждого вызова хранилища (finai_storage_seconds{backend="mongo_sync"})
+_timed = metrics.timed(metrics.STORAGE_SECONDS, backend="mongo_sync")
+
+
+# Индексы уже созданы этим процессом (ensure_indexes)
+_indexes_ready = False
+
+
+@_timed
+def ensure_indexes():
+    """
+    Идемпотентно создаёт индексы INDEXES. Upsert'ы профиля (create_user,
+    add_category, версия данных) опираются на уникальность tg_id, поэтому
+    записи сами вызывают его один раз на процесс (_require_indexes); вызов
+    при старте лишь переносит эту работу из первого запроса.
+    """
+    global _indexes_ready
+    for name, indexes in INDEXES.items():
+        db[name].create_indexes(indexes)
+    _indexes_ready = True
+
+
+def _require_indexes():
+    if not _indexes_ready:
+        ensure_indexes()
 
 
 # -------------------------------
 # Пользователь
 # -------------------------------
+@_timed
 def get_user(tg_id: int):
-    return users_col.find_one({"tg_id": tg_id})
+    return users_col.find_one({"tg_id": tg_id}, USER_PROJECTION)
 
 
+@_timed
 def create_user(tg_id: int, name: str = "Unknown"):
-    user = get_user(tg_id)
-    if user:
-        return user
-    user_doc = {
-        "tg_id": tg_id,
-        "name": name,
-        "categories": [],
-        "transactions": []
-    }
-    users_col.insert_one(user_doc)
-    return user_doc
+    _require_indexes()
+    query, update = user_upsert(tg_id, name)
+    user = users_col.find_one_and_update(
+        query, update,
+        projection=USER_PROJECTION,
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return user
+
+
+@_timed
+def get_data_version(tg_id: int) -> int:
+    """Счётчик изменений данных пользователя (0, если записей ещё не было)."""
+    user = users_col.find_one({"tg_id": tg_id}, {"version": 1})
+    return (user or {}).get("version", 0)
 
 
 # -------------------------------
 # Категории
 # -------------------------------
+@_timed
 def add_category(tg_id: int, name: str):
-    user = create_user(tg_id)
-    if name in [c["name"] for c in user["categories"]]:
+    _require_indexes()
+    try:
+        users_col.update_one(*category_push(tg_id, name), upsert=True)
+    except DuplicateKeyError:
         return None  # уже есть
-    users_col.update_one(
-        {"tg_id": tg_id},
-        {"$push": {"categories": {"_id": ObjectId(), "name": name}}}
-    )
+    vocabularies.invalidate(tg_id)  # словарь категорий для парсера пересоберётся
     return name
 
 
+@_timed
 def get_categories(tg_id: int):
-    user = get_user(tg_id)
+    user = users_col.find_one({"tg_id": tg_id}, {"categories": 1})
     if not user:
         return []
     return user.get("categories", [])
@@ -57,25 +98,254 @@ def get_categories(tg_id: int):
 # -------------------------------
 # Транзакции
 # -------------------------------
+# False после первого отказа client.bulk_write (сервер старше 8.0)
+_client_bulk = True
+
+
+def _write_transactions(txs):
+    global _client_bulk
+    _require_indexes()
+    writes = transaction_writes(txs, db.name)
+    if _client_bulk:
+        try:
+            client.bulk_write([op for _, op in writes])
+            return
+        except InvalidOperation:
+            _client_bulk = False
+    for name, ops in writes_by_collection(writes).items():
+        db[name].bulk_write(ops)
+
+
+@_timed
 def add_transaction(tg_id: int, amount: float, category: str, date: str = None):
-    user = create_user(tg_id)
-    if not date:
-        date = datetime.now().strftime("%Y-%m-%d")
-    tx = {
-        "_id": ObjectId(),
-        "amount": amount,
-        "category": category,
-        "date": date
-    }
-    users_col.update_one(
-        {"tg_id": tg_id},
-        {"$push": {"transactions": tx}}
-    )
+    today = datetime.now().strftime("%Y-%m-%d")
+    tx = tx_doc(tg_id, {"amount": amount, "category": category, "date": date}, today)
+    _write_transactions([tx])
     return tx
 
 
-def get_transactions(tg_id: int):
-    user = get_user(tg_id)
-    if not user:
+@_timed
+def add_transactions(tg_id: int, items):
+    """
+    Пакетная запись: items — последовательность dict с amount, category
+    и необязательной date. Транзакции, свёртки и версия уходят одним
+    запросом (transaction_writes). Возвращает список записанных документов.
+    """
+    today = datetime.now().strftime("%Y-%m-%d")
+    txs = [tx_doc(tg_id, item, today) for item in items]
+    if not txs:
         return []
-    return user.get("transactions", [])
+    _write_transactions(txs)
+    return txs
+
+
+@_timed
+def get_transactions(tg_id: int, date_from=None, date_to=None, limit: int = None, after: dict = None):
+    """
+    Транзакции пользователя по возрастанию (date, _id).
+    date_from/date_to — включительные границы ("YYYY-MM-DD" или date/datetime).
+    limit — размер страницы; after — последняя транзакция предыдущей страницы
+    (keyset-курсор), следующая страница начинается строго после неё.
+    """
+    query = tx_page_filter(tg_id, date_from, date_to, after)
+    cursor = transactions_col.find(query, TX_PROJECTION).sort(TX_SORT)
+    if limit:
+        cursor = cursor.limit(limit)
+    return list(cursor)
+
+
+# -------------------------------
+# Аналитика
+# -------------------------------
+# Ключ группировки по строковой дате "YYYY-MM-DD"
+PERIOD_KEYS = {
+    "day": "$date",
+    "week": {"$dateToString": {
+        "format": "%G-W%V",
+        "date": {"$dateFromString": {"dateString": "$date", "format": "%Y-%m-%d"}},
+    }},
+    "month": {"$substr": ["$date", 0, 7]},
+}
+
+
+@_timed
+def totals_by_category(tg_id: int, date_from=None, date_to=None):
+    """
+    Сумма и число транзакций по категориям, по убыванию суммы.
+    date_from/date_to — включительные границы, как в get_transactions и db.py.
+    """
+    pipeline = [
+        {"$match": tx_filter(tg_id, date_from, date_to)},
+        {"$group": {"_id": "$category", "total": {"$sum": "$amount"}, "count": {"$sum": 1}}},
+        {"$sort": {"total": -1}},
+    ]
+    return [
+        {"category": r["_id"], "total": r["total"], "count": r["count"]}
+        for r in transactions_col.aggregate(pipeline)
+    ]
+
+
+@_timed
+def totals_by_period(tg_id: int, period: str = "month", date_from=None, date_to=None):
+    """Сумма и число транзакций по дням, ISO-неделям ("YYYY-Www") или месяцам (period: day|week|month)."""
+    pipeline = [
+        {"$match": tx_filter(tg_id, date_from, date_to)},
+        {"$group": {"_id": PERIOD_KEYS[period], "total": {"$sum": "$amount"}, "count": {"$sum": 1}}},
+        {"$sort": {"_id": 1}},
+    ]
+    return [
+        {"period": r["_id"], "total": r["total"], "count": r["count"]}
+        for r in transactions_col.aggregate(pipeline)
+    ]
+
+
+@_timed
+def income_vs_expense(tg_id: int, date_from=None, date_to=None):
+    """Доходы, расходы и баланс за период одним документом."""
+    is_income = {"$in": ["$category", INCOME_CATEGORIES]}
+    pipeline = [
+        {"$match": tx_filter(tg_id, date_from, date_to)},
+        {"$group": {
+            "_id": None,
+            "income": {"$sum": {"$cond": [is_income, "$amount", 0]}},
+            "expense": {"$sum": {"$cond": [is_income, 0, "$amount"]}},
+        }},
+    ]
+    result = next(transactions_col.aggregate(pipeline), {"income": 0, "expense": 0})
+    return {
+        "income": result["income"],
+        "expense": result["expense"],
+        "balance": result["income"] - result["expense"],
+    }
+
+
+# -------------------------------
+# Месячные свёртки
+# -------------------------------
+@_timed
+def monthly_summary(tg_id: int, month: str):
+    """Суммы по категориям за месяц ("YYYY-MM") из свёрток, без сканирования транзакций."""
+    return list(rollups_col.find(
+        {"tg_id": tg_id, "month": month},
+        {"_id": 0, "category": 1, "total": 1, "count": 1},
+    ).sort("total", -1))
+
+
+@_timed
+def month_category_total(tg_id: int, month: str, category: str) -> float:
+    """Сумма по одной категории за месяц — для проверки бюджета."""
+    doc = rollups_col.find_one({"tg_id": tg_id, "month": month, "category": category}, {"total": 1})
+    return doc["total"] if doc else 0
+
+
+def _rollup_totals(tg_id: int):
+    """{(month, category): (total, count)} пользователя, посчитанные по сырым транзакциям."""
+    pipeline = [
+        {"$match": {"tg_id": tg_id}},
+        {"$group": {
+            "_id": {"month": {"$substr": ["$date", 0, 7]}, "category": "$category"},
+            "total": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+        }},
+    ]
+    return {
+        (r["_id"]["month"], r["_id"]["category"]): (r["total"], r["count"])
+        for r in transactions_col.aggregate(pipeline, allowDiskUse=True)
+    }
+
+
+def _reconcile_user(tg_id: int):
+    """
+    Один проход сверки свёрток пользователя: (исправлено, конфликтов).
+    Свёртки читаются до пересчёта, и каждая заменяется $set только при
+    прежних total/count: если живой $inc успел раньше, фильтр не совпадёт,
+    и ключ остаётся до следующего прохода.
+    """
+    current = {
+        (d["month"], d["category"]): (d.get("total"), d.get("count"))
+        for d in rollups_col.find({"tg_id": tg_id}, {"_id": 0, "month": 1, "category": 1, "total": 1, "count": 1})
+    }
+    fresh = _rollup_totals(tg_id)
+    fixed = conflicts = 0
+    for key in current.keys() | fresh.keys():
+        if current.get(key) == fresh.get(key):
+            continue
+        month, category = key
+        query = {"tg_id": tg_id, "month": month, "category": category}
+        if key not in current:
+            # свёртки не было: создаём, если живая запись не создала её раньше
+            total, count = fresh[key]
+            done = rollups_col.update_one(
+                query, {"$setOnInsert": {"total": total, "count": count}}, upsert=True,
+            ).upserted_id is not None
+        else:
+            query["total"], query["count"] = current[key]
+            if key not in fresh:
+                done = rollups_col.delete_one(query).deleted_count == 1
+            else:
+                total, count = fresh[key]
+                done = rollups_col.update_one(query, {"$set": {"total": total, "count": count}}).matched_count == 1
+        fixed += done
+        conflicts += not done
+    return fixed, conflicts
+
+
+@_timed
+def rebuild_rollups(tg_id: int = None, attempts: int = 5):
+    """
+    Сверяет свёртки с сырыми транзакциями (всех пользователей или одного)
+    и исправляет расхождения: после ручных правок/удалений транзакций или
+    записи, оборвавшейся между вставкой и свёрткой (см. transaction_writes).
+    Свёртки не удаляются целиком — каждая заменяется под защитой своих
+    total/count (_reconcile_user), поэтому $inc от бота во время сверки
+    не теряются и не считаются дважды. Возвращает число исправленных свёрток.
+    """
+    if tg_id is not None:
+        tg_ids = [tg_id]
+    else:
+        tg_ids = set(transactions_col.distinct("tg_id")) | set(rollups_col.distinct("tg_id"))
+    fixed = 0
+    for user in tg_ids:
+        for _ in range(attempts):
+            done, conflicts = _reconcile_user(user)
+            fixed += done
+            if not conflicts:
+                break
+        else:
+            logging.warning(f"[ROLLUPS] {user}: свёртки меняются во время сверки, повторите позже")
+    return fixed
+
+
+# -------------------------------
+# Миграция
+# -------------------------------
+@_timed
+def migrate_embedded_transactions():
+    """
+    Переносит встроенные массивы users.transactions в коллекцию transactions.
+    _id транзакций сохраняются, поэтому повторный запуск безопасен.
+    Возвращает число перенесённых транзакций.
+    """
+    moved = 0
+    for user in users_col.find({"transactions.0": {"$exists": True}}, {"tg_id": 1, "transactions": 1}):
+        docs = [dict(tx, tg_id=user["tg_id"], date=date_str(tx.get("date"))) for tx in user["transactions"]]
+        transactions_col.bulk_write([ReplaceOne({"_id": tx["_id"]}, tx, upsert=True) for tx in docs])
+        users_col.update_one({"_id": user["_id"]}, {"$unset": {"transactions": ""}})
+        moved += len(docs)
+    return moved
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Обслуживание базы finance_app")
+    parser.add_argument("command", choices=["migrate", "rebuild-rollups"])
+    parser.add_argument("--tg-id", type=int, default=None, help="только для одного пользователя")
+    args = parser.parse_args()
+
+    ensure_indexes()
+    if args.command == "migrate":
+        print(f"Перенесено транзакций: {migrate_embedded_transactions()}")
+        print(f"Свёрток исправлено: {rebuild_rollups()}")
+    elif args.command == "rebuild-rollups":
+        print(f"Свёрток исправлено: {rebuild_rollups(args.tg_id)}")
@@ -0,0 +1,128 @@
+# dates.py
+# Single-pass extractor for the date forms people actually type in expense
+# messages: "вчера", "3 дня назад", "3 марта", "15.02.2024", "с 15.02",
+# "2024-02-15", "в прошлую пятницу". Returns None when the text has no date,
+# unlike fuzzy dateutil which falls back to the reference date. Results are
+# memoized per (text, reference day).
+import os
+import re
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Optional, Tuple
+
+DATES_CACHE_SIZE = int(os.getenv("DATES_CACHE_SIZE", "4096"))
+
+# Longer words first so "позавчера" is not read as "вчера"
+RELATIVE_DAYS = {
+    "позавчера": -2,
+    "послезавтра": 2,
+    "вчера": -1,
+    "сегодня": 0,
+    "завтра": 1,
+}
+
+MONTHS = {
+    "январ": 1, "феврал": 2, "март": 3, "апрел": 4, "ма": 5, "июн": 6,
+    "июл": 7, "август": 8, "сентябр": 9, "октябр": 10, "ноябр": 11, "декабр": 12,
+}
+
+WEEKDAYS = {
+    "понедельник": 0, "вторник": 1, "среда": 2, "среду": 2, "четверг": 3,
+    "пятница": 4, "пятницу": 4, "суббота": 5, "субботу": 5, "воскресенье": 6,
+}
+
+# Weekday modifiers: offset in weeks from the current calendar week
+WEEK_SHIFTS = {"позапрошл": -2, "прошл": -1, "эт": 0, "следующ": 1}
+
+_NOT_MONEY = r"(?!\s*(?:₽|руб|rub|р\b|\$|€|usd|eur))"
+# A bare "7.10" is as likely an amount as a date: without a year, day.month
+# counts only after one of these prepositions ("с 15.02", "до 1.03")
+DATE_PREPOSITIONS = ("с", "до", "на")
+
+DATE_RE = re.compile(
+    r"\b(?P<iy>\d{4})-(?P<im>\d{2})-(?P<id>\d{2})\b"
+    r"|\b(?P<nd>\d{1,2})[./](?P<nm>\d{1,2})[./](?P<ny>\d{4}|\d{2})\b" + _NOT_MONEY +
+    r"|\b(?:" + "|".join(DATE_PREPOSITIONS) + r")\s+(?P<pd>\d{1,2})[./](?P<pm>\d{1,2})\b(?![./]?\d)" + _NOT_MONEY +
+    r"|\b(?P<md>\d{1,2})\s+(?P<mm>январ[ья]|феврал[ья]|марта?|апрел[ья]|ма[йя]|июн[ья]|июл[ья]"
+    r"|августа?|сентябр[ья]|октябр[ья]|ноябр[ья]|декабр[ья])(?:\s+(?P<my>\d{4}))?\b"
+    r"|\b(?:(?P<ago_n>\d{1,3})\s+)?(?P<ago_unit>день|дня|дней|неделю|недели|недель)\s+назад\b"
+    r"|\b(?:(?P<shift>позапрошл|прошл|эт|следующ)\w*\s+)?(?P<wd>" + "|".join(WEEKDAYS) + r")\b"
+    r"|\b(?P<rel>" + "|".join(RELATIVE_DAYS) + r")\b"
+)
+
+
+def _month(word: str) -> int:
+    for stem, month in MONTHS.items():
+        if word.startswith(stem):
+            return month
+    raise ValueError(word)
+
+
+def _year(value: Optional[str]) -> Optional[int]:
+    if not value:
+        return None
+    year = int(value)
+    return year + 2000 if year < 100 else year
+
+
+def _day_month(day: int, month: int, year: Optional[int], ref: date) -> date:
+    if year is not None:
+        return date(year, month, day)
+    d = date(ref.year, month, day)
+    # expenses are in the past: "3 марта" typed on March 2nd is last year
+    return d.replace(year=ref.year - 1) if d > ref else d
+
+
+def _resolve(m: re.Match, ref: date) -> date:
+    g = m.groupdict()
+    if g["iy"]:
+        return date(int(g["iy"]), int(g["im"]), int(g["id"]))
+    if g["nd"]:
+        return _day_month(int(g["nd"]), int(g["nm"]), _year(g["ny"]), ref)
+    if g["pd"]:
+        return _day_month(int(g["pd"]), int(g["pm"]), None, ref)
+    if g["md"]:
+        return _day_month(int(g["md"]), _month(g["mm"]), _year(g["my"]), ref)
+    if g["ago_unit"]:
+        n = int(g["ago_n"] or 1)
+        days = n * 7 if g["ago_unit"].startswith("недел") else n
+        return ref - timedelta(days=days)
+    if g["wd"]:
+        target = WEEKDAYS[g["wd"]]
+        if g["shift"] is None:
+            # plain weekday: the latest one on or before today
+            return ref - timedelta(days=(ref.weekday() - target) % 7)
+        monday = ref - timedelta(days=ref.weekday())
+        return monday + timedelta(weeks=WEEK_SHIFTS[g["shift"]], days=target)
+    return ref + timedelta(days=RELATIVE_DAYS[g["rel"]])
+
+
+@lru_cache(maxsize=DATES_CACHE_SIZE)
+def _find(text: str, ref: date) -> Optional[Tuple[date, Tuple[int, int]]]:
+    for m in DATE_RE.finditer(text):
+        try:
+            # the span leaves a preposition in the text, only the date is cut out
+            return _resolve(m, ref), (m.start("pd") if m.group("pd") else m.start(), m.end())
+        except ValueError:
+            continue  # "31.02", "15.13": not a date, keep looking
+    return None
+
+
+def find_date(text: str, ref: date = None) -> Optional[Tuple[date, Tuple[int, int]]]:
+    """(date, span of the match) for the first date in text, or None."""
+    ref = ref or date.today()
+    return _find(text.lower().replace("ё", "е"), ref)
+
+
+def parse_date(text: str, ref: datetime = None) -> Optional[datetime]:
+    """First date in text as a datetime at noon (like the old keyword path), or None."""
+    ref = ref or datetime.now()
+    found = find_date(text, ref.date())
+    if found is None:
+        return None
+    d = found[0]
+    return datetime(d.year, d.month, d.day, 12)
+
+
+def cache_info():
+    return _find.cache_info()
@@ -1,20 +1,51 @@
 # db.py
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Text, Boolean, Index, UniqueConstraint, and_, case, cast, delete, event, func, insert, or_, select, update
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
+from sqlalchemy.orm import Session, sessionmaker, relationship
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./finance.db")
 
-# For SQLite: connect_args
-connect_args = {}
-if DATABASE_URL.startswith("sqlite"):
-    connect_args = {"check_same_thread": False}
+# SQLite production profile: WAL lets the bot write while the mini app reads,
+# synchronous=NORMAL is durable under WAL with one fsync per checkpoint.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KB", "65536")),  # negative = KiB
+    "temp_store": "MEMORY",
+}
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args, echo=False, future=True)
+# Pool settings for server databases (ignored for SQLite)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+def make_engine(url: str = DATABASE_URL, **kwargs):
+    """Engine with the SQLite pragma profile or a tuned pool for other URLs."""
+    if url.startswith("sqlite"):
+        kwargs.setdefault("connect_args", {"check_same_thread": False})
+    else:
+        kwargs.setdefault("pool_size", POOL_SIZE)
+        kwargs.setdefault("max_overflow", POOL_MAX_OVERFLOW)
+        kwargs.setdefault("pool_recycle", POOL_RECYCLE)
+        kwargs.setdefault("pool_pre_ping", True)
+    eng = create_engine(url, echo=False, future=True, **kwargs)
+    if url.startswith("sqlite"):
+        event.listen(eng, "connect", _apply_sqlite_pragmas)
+    return eng
+
+engine = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 Base = declarative_base()
 
@@ -32,6 +63,8 @@ class User(Base):
 
 class Category(Base):
     __tablename__ = "categories"
+    # One row per name: concurrent first writes rely on ON CONFLICT against it
+    __table_args__ = (Index("uq_categories_user_name", "user_id", "name", unique=True),)
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     name = Column(String, index=True)
@@ -42,6 +75,7 @@ class Category(Base):
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (Index("ix_transactions_user_date", "user_id", "date"),)
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     amount = Column(Float)
@@ -53,8 +87,38 @@ class Transaction(Base):
 
     user = relationship("User", back_populates="transactions")
 
+# Category for rows that arrive without one, as ai.extract_category falls back to
+DEFAULT_CATEGORY = "others"
+
+class MonthlyRollup(Base):
+    """Running sum/count per (user, month, category), kept in step with Transaction inserts."""
+    __tablename__ = "monthly_rollups"
+    __table_args__ = (UniqueConstraint("user_id", "month", "category", name="uq_rollup_user_month_category"),)
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    month = Column(String(7), nullable=False)  # "YYYY-MM"
+    category = Column(String, nullable=False)
+    total = Column(Float, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+def _dedupe_categories(conn):
+    """Keep the oldest of duplicate (user_id, name) rows so the unique index can be built."""
+    keep = select(func.min(Category.id)).group_by(Category.user_id, Category.name)
+    conn.execute(delete(Category).where(Category.id.not_in(keep)))
+
+def create_schema(conn):
+    """Tables plus indexes added since they were created; pass to run_sync for async engines."""
+    Base.metadata.create_all(bind=conn)
+    # create_all skips indexes on tables that already exist; transactions
+    # refer to categories by name, so dropping duplicate rows is safe
+    _dedupe_categories(conn)
+    for table in (Category, Transaction):
+        for index in table.__table__.indexes:
+            index.create(bind=conn, checkfirst=True)
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        create_schema(conn)
 
 # helper context manager
 from contextlib import contextmanager
@@ -70,3 +134,214 @@ def get_session():
         raise
     finally:
         session.close()
+
+
+# ============================================================
+# Keyset pagination
+# ============================================================
+def list_transactions(session, user_id: int, before=None, limit: int = 50):
+    """
+    Newest-first page of a user's transactions. Pass the last Transaction
+    of the previous page as `before`; the (user_id, date) index makes deep
+    pages as cheap as the first one, unlike OFFSET.
+    """
+    stmt = select(Transaction).where(Transaction.user_id == user_id)
+    if before is not None:
+        stmt = stmt.where(or_(
+            Transaction.date < before.date,
+            and_(Transaction.date == before.date, Transaction.id < before.id),
+        ))
+    stmt = stmt.order_by(Transaction.date.desc(), Transaction.id.desc()).limit(limit)
+    return list(session.scalars(stmt))
+
+
+# ============================================================
+# Monthly rollups
+# ============================================================
+def conflict_insert(dialect: str):
+    """insert() with on_conflict_* for SQLite/PostgreSQL, None for other dialects."""
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+def _upsert_rollup(session, user_id: int, month: str, category: str, total: float, count: int):
+    dialect_insert = conflict_insert(session.get_bind().dialect.name)
+    values = {"user_id": user_id, "month": month, "category": category, "total": total, "count": count}
+    if dialect_insert is not None:
+        stmt = dialect_insert(MonthlyRollup).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "month", "category"],
+            set_={"total": MonthlyRollup.total + stmt.excluded.total,
+                  "count": MonthlyRollup.count + stmt.excluded.count},
+        )
+        session.execute(stmt)
+        return
+    result = session.execute(
+        update(MonthlyRollup)
+        .where(MonthlyRollup.user_id == user_id, MonthlyRollup.month == month, MonthlyRollup.category == category)
+        .values(total=MonthlyRollup.total + total, count=MonthlyRollup.count + count)
+    )
+    if result.rowcount == 0:
+        session.execute(insert(MonthlyRollup).values(**values))
+
+def apply_rollups(session, rows):
+    """
+    Add transaction rows (objects or dicts with user_id/amount/category/date)
+    to the rollups inside the caller's DB transaction. Bulk Core inserts that
+    bypass the ORM flush must call this themselves. Rows without a user or a
+    category are skipped, as in rebuild_rollups.
+    """
+    deltas = {}
+    for row in rows:
+        get = row.get if isinstance(row, dict) else lambda k: getattr(row, k)
+        if get("user_id") is None or get("category") is None:
+            continue
+        key = (get("user_id"), (get("date") or datetime.utcnow()).strftime("%Y-%m"), get("category"))
+        total, count = deltas.get(key, (0, 0))
+        deltas[key] = (total + (get("amount") or 0), count + 1)
+    for (user_id, month, category), (total, count) in deltas.items():
+        _upsert_rollup(session, user_id, month, category, total, count)
+
+@event.listens_for(Session, "before_flush")
+def _rollups_before_flush(session, flush_context, instances):
+    new_txs = [obj for obj in session.new if isinstance(obj, Transaction)]
+    for tx in new_txs:
+        if tx.date is None:
+            tx.date = datetime.utcnow()
+    if new_txs:
+        apply_rollups(session, new_txs)
+
+def monthly_summary(session, user_id: int, month: str):
+    """Per-category totals for one month ("YYYY-MM") straight from the rollups."""
+    rows = session.execute(
+        select(MonthlyRollup.category, MonthlyRollup.total, MonthlyRollup.count)
+        .where(MonthlyRollup.user_id == user_id, MonthlyRollup.month == month)
+        .order_by(MonthlyRollup.total.desc())
+    )
+    return [{"category": c, "total": t, "count": n} for c, t, n in rows]
+
+def month_category_total(session, user_id: int, month: str, category: str) -> float:
+    """Single rollup lookup, e.g. for budget checks."""
+    return session.execute(
+        select(MonthlyRollup.total)
+        .where(MonthlyRollup.user_id == user_id, MonthlyRollup.month == month, MonthlyRollup.category == category)
+    ).scalar() or 0
+
+def rebuild_rollups(session, user_id: int = None) -> int:
+    """Recompute rollups from raw transactions (all users or one). Returns row count."""
+    month = _period_expr("month", session.get_bind().dialect.name)
+    src = select(
+        Transaction.user_id, month, Transaction.category,
+        func.sum(Transaction.amount), func.count(Transaction.id),
+    ).where(Transaction.user_id.is_not(None), Transaction.category.is_not(None))
+    clear = delete(MonthlyRollup)
+    if user_id is not None:
+        src = src.where(Transaction.user_id == user_id)
+        clear = clear.where(MonthlyRollup.user_id == user_id)
+    src = src.group_by(Transaction.user_id, month, Transaction.category)
+    session.execute(clear)
+    result = session.execute(
+        insert(MonthlyRollup).from_select(["user_id", "month", "category", "total", "count"], src)
+    )
+    return result.rowcount
+
+
+# ============================================================
+# Analytics (GROUP BY on the server, only aggregates come back)
+# ============================================================
+# Category names counted as income in addition to Category.is_income
+INCOME_CATEGORIES = ["income"]
+
+def as_day(value) -> datetime:
+    """Midnight of value (ISO string, date or datetime); the bots store dates to the day."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return datetime(value.year, value.month, value.day)
+
+def _iso_week_sqlite(column):
+    """"YYYY-Www" ISO week: SQLite's %W is not ISO, so take year and week of the week's Thursday."""
+    thursday = func.date(column, "weekday 0", "-3 days")
+    week = (cast(func.strftime("%j", thursday), Integer) - 1) // 7 + 1
+    return func.printf("%s-W%02d", func.strftime("%Y", thursday), week)
+
+def _period_expr(period: str, dialect: str):
+    # Same keys as database.PERIOD_KEYS: "YYYY-MM-DD", ISO "YYYY-Www", "YYYY-MM".
+    # dialect is the session's (session.get_bind()), not the module engine's
+    if dialect == "sqlite":
+        if period == "week":
+            return _iso_week_sqlite(Transaction.date)
+        fmt = {"day": "%Y-%m-%d", "month": "%Y-%m"}[period]
+        return func.strftime(fmt, Transaction.date)
+    fmt = {"day": "YYYY-MM-DD", "week": 'IYYY-"W"IW', "month": "YYYY-MM"}[period]
+    return func.to_char(Transaction.date, fmt)
+
+def _in_range(stmt, user_id: int, date_from=None, date_to=None):
+    """Both bounds inclusive by day, as in database.py (Mongo)."""
+    stmt = stmt.where(Transaction.user_id == user_id)
+    if date_from:
+        stmt = stmt.where(Transaction.date >= as_day(date_from))
+    if date_to:
+        stmt = stmt.where(Transaction.date < as_day(date_to) + timedelta(days=1))
+    return stmt
+
+def totals_by_category(session, user_id: int, date_from=None, date_to=None):
+    """Sum and count per category from date_from to date_to inclusive, largest first."""
+    total = func.sum(Transaction.amount)
+    stmt = _in_range(
+        select(Transaction.category, total, func.count(Transaction.id)),
+        user_id, date_from, date_to,
+    ).group_by(Transaction.category).order_by(total.desc())
+    return [
+        {"category": category, "total": total, "count": count}
+        for category, total, count in session.execute(stmt)
+    ]
+
+def totals_by_period(session, user_id: int, period: str = "month", date_from=None, date_to=None):
+    """Sum and count per day, ISO week or month from date_from to date_to inclusive."""
+    key = _period_expr(period, session.get_bind().dialect.name).label("period")
+    stmt = _in_range(
+        select(key, func.sum(Transaction.amount), func.count(Transaction.id)),
+        user_id, date_from, date_to,
+    ).group_by(key).order_by(key)
+    return [
+        {"period": p, "total": total, "count": count}
+        for p, total, count in session.execute(stmt)
+    ]
+
+def income_vs_expense(session, user_id: int, date_from=None, date_to=None):
+    """Income, expense and balance from date_from to date_to inclusive, as one row."""
+    # EXISTS, not a join: each transaction is counted once even if the
+    # category name matches several rows
+    income_category = select(Category.id).where(
+        Category.user_id == Transaction.user_id,
+        Category.name == Transaction.category,
+        Category.is_income.is_(True),
+    ).exists()
+    is_income = or_(Transaction.category.in_(INCOME_CATEGORIES), income_category)
+    stmt = _in_range(
+        select(
+            func.coalesce(func.sum(case((is_income, Transaction.amount), else_=0)), 0),
+            func.coalesce(func.sum(case((is_income, 0), else_=Transaction.amount)), 0),
+        ).select_from(Transaction),
+        user_id, date_from, date_to,
+    )
+    income, expense = session.execute(stmt).one()
+    return {"income": income, "expense": expense, "balance": income - expense}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="finance.db maintenance")
+    parser.add_argument("command", choices=["init", "rebuild-rollups"])
+    parser.add_argument("--user-id", type=int, default=None, help="only this user")
+    args = parser.parse_args()
+
+    init_db()
+    if args.command == "rebuild-rollups":
+        with get_session() as session:
+            print(f"Rollups rebuilt: {rebuild_rollups(session, args.user_id)}")
@@ -0,0 +1,130 @@
+# llm_batch.py
+# Micro-batching for LLM extraction: messages arriving within a short window
+# are sent as one chat completion that returns a JSON array, and each waiting
+# handler gets its own item back. Items the model gets wrong fall back to the
+# regex extractor, so one bad element never fails the whole batch.
+import os
+import json
+import asyncio
+import logging
+from contextlib import nullcontext
+from typing import Any, AsyncContextManager, Callable, Dict, List, Optional
+
+import ai
+
+LLM_BATCH_MS = int(os.getenv("LLM_BATCH_MS", "0"))
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "16"))
+# completion budget per message in the batch
+LLM_BATCH_TOKENS_PER_ITEM = 80
+
+BATCH_SYSTEM_PROMPT = (
+    "Ты — финансовый ассистент. На вход — JSON-массив сообщений пользователей.\n"
+    "Для каждого сообщения извлеки данные о транзакции и верни строго JSON-массив "
+    "той же длины и в том же порядке, без пояснений:\n"
+    "[{i: номер сообщения,\n"
+    "  intent: 'добавить_трату' | 'показать_аналитику' | 'дать_совет',\n"
+    "  amount: число | null,\n"
+    "  category: строка | null,\n"
+    "  date: ISO8601 | null}]\n"
+)
+INTENTS = ("добавить_трату", "показать_аналитику", "дать_совет")
+
+
+def fallback_item(text: str) -> Dict[str, Any]:
+    """Regex extraction (ai.extract_entities + intent) in the LLM item format."""
+    parsed = ai.regex_parse(text)
+    return {
+        "intent": parsed["intent"] or "unknown",
+        "amount": parsed["amount"],
+        "category": parsed["category"],
+        "date": parsed["date"].date().isoformat() if parsed["date"] else None,
+        "fallback": True,
+    }
+
+
+def parse_batch(raw: str, size: int) -> List[Optional[Dict[str, Any]]]:
+    """
+    Items of the JSON array in the reply, placed by their "i" (or position).
+    Missing or malformed items are None.
+    """
+    items: List[Optional[Dict[str, Any]]] = [None] * size
+    start, end = raw.find("["), raw.rfind("]")
+    if start == -1 or end < start:
+        return items
+    try:
+        array = json.loads(raw[start:end + 1])
+    except ValueError:
+        return items
+    if not isinstance(array, list):
+        return items
+    for pos, item in enumerate(array):
+        if not isinstance(item, dict) or item.get("intent") not in INTENTS:
+            continue
+        idx = item.pop("i", pos)
+        if isinstance(idx, int) and 0 <= idx < size and items[idx] is None:
+            items[idx] = item
+    return items
+
+
+class BatchExtractor:
+    """
+    Collects extract() calls made within window seconds (or up to max_batch)
+    and answers them with one LLM request. Each caller gets its own dict.
+    slot() is entered around each outgoing request (e.g. a scheduler slot),
+    so rate limits are paid per request, not per message.
+    """
+
+    def __init__(self, client: ai.AsyncOpenRouterClient, window: float, max_batch: int = LLM_BATCH_SIZE,
+                 slot: Optional[Callable[[], AsyncContextManager]] = None):
+        self.client = client
+        self.window = window
+        self.max_batch = max_batch
+        self.slot = slot or nullcontext
+        self._pending = []
+        self._timer = None
+        self.stats = {"requests": 0, "items": 0, "fallbacks": 0}
+
+    async def extract(self, text: str) -> Dict[str, Any]:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        texts = [text for text, _ in batch]
+        messages = [
+            {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+            {"role": "user", "content": json.dumps(texts, ensure_ascii=False)},
+        ]
+        self.stats["requests"] += 1
+        self.stats["items"] += len(batch)
+        try:
+            async with self.slot():
+                raw = await self.client.chat(messages, max_tokens=LLM_BATCH_TOKENS_PER_ITEM * len(batch) + 50)
+            items = parse_batch(raw, len(batch))
+        except Exception as e:
+            logging.error(f"LLM batch of {len(batch)} failed: {e}")
+            items = [None] * len(batch)
+        for (text, future), item in zip(batch, items):
+            if item is None:
+                self.stats["fallbacks"] += 1
+                item = fallback_item(text)
+            if not future.done():
+                future.set_result(item)
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
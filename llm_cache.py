@@ -0,0 +1,173 @@
+# llm_cache.py
+# Two-tier cache for LLM responses: in-memory LRU in front of a SQLite file,
+# keyed on normalized message text + model + prompt template version.
+# Repeated phrasings ("кофе 250", re-sent receipts) skip the API entirely.
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Optional
+
+import dates
+import metrics
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./llm_cache.db")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MEMORY_SIZE = int(os.getenv("LLM_CACHE_MEMORY_SIZE", "2048"))
+LLM_CACHE_MAX_ROWS = int(os.getenv("LLM_CACHE_MAX_ROWS", "100000"))
+
+# Period words dates.find_date does not resolve but the LLM does ("на этой
+# неделе", "в прошлом месяце"); see mentions_date
+RELATIVE_DATE_RE = re.compile(r"вчера|сегодня|завтра|прошл|следующ|назад|недел|месяц")
+
+
+def normalize_text(text: str) -> str:
+    t = text.lower().replace("ё", "е")
+    t = re.sub(r"\s+", " ", t).strip()
+    return t.strip(" .,!?;:")
+
+
+def mentions_date(norm: str) -> bool:
+    """
+    Any date in the text: weekdays, yearless "3 марта" / "12.05" and relative
+    words are all resolved against today, so their answers go stale tomorrow.
+    """
+    return dates.find_date(norm) is not None or RELATIVE_DATE_RE.search(norm) is not None
+
+
+def make_key(text: str, model: str, template_version: str) -> str:
+    norm = normalize_text(text)
+    day = date.today().isoformat() if mentions_date(norm) else ""
+    raw = "\x1f".join([norm, model, template_version, day])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class LLMCache:
+    """
+    get/set for sync callers; async code uses aget/aset, which run the
+    SQLite tier in a worker thread so the event loop only touches memory.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: int = LLM_CACHE_TTL,
+                 memory_size: int = LLM_CACHE_MEMORY_SIZE, max_rows: int = LLM_CACHE_MAX_ROWS):
+        self.path = path
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()  # memory tier and stats: held only briefly
+        self._db_lock = threading.Lock()  # SQLite tier, taken in worker threads
+        self._conn = None
+        self._writes = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_created ON llm_cache (created_at)")
+        return self._conn
+
+    def _remember(self, key: str, expires_at: float, value: Any):
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _memory_get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if entry[0] > now:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry[1]
+            del self._memory[key]
+            return None
+
+    def _disk_get(self, key: str) -> Optional[Any]:
+        with self._db_lock:
+            row = self._db().execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        if row is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        value = json.loads(row[0])
+        self._remember(key, row[1], value)
+        with self._lock:
+            self.stats["disk_hits"] += 1
+        return value
+
+    def _disk_set(self, key: str, value: Any, now: float, expires_at: float):
+        with self._db_lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, expires_at),
+            )
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                self._evict(now)
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._memory_get(key)
+        return value if value is not None else self._disk_get(key)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        value = self._memory_get(key)
+        return value if value is not None else await asyncio.to_thread(self._disk_get, key)
+
+    def set(self, key: str, value: Any):
+        now = time.time()
+        self._remember(key, now + self.ttl, value)
+        self._disk_set(key, value, now, now + self.ttl)
+
+    async def aset(self, key: str, value: Any):
+        now = time.time()
+        self._remember(key, now + self.ttl, value)
+        await asyncio.to_thread(self._disk_set, key, value, now, now + self.ttl)
+
+    def _evict(self, now: float):
+        db = self._db()
+        db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+        (rows,) = db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        if rows > self.max_rows:
+            db.execute(
+                "DELETE FROM llm_cache WHERE key IN"
+                " (SELECT key FROM llm_cache ORDER BY created_at LIMIT ?)",
+                (rows - self.max_rows,),
+            )
+
+    def evict(self):
+        """Drop expired rows and trim to max_rows (also runs every 1000 writes)."""
+        with self._db_lock:
+            self._evict(time.time())
+
+    def snapshot(self) -> dict:
+        lookups = sum(self.stats.values())
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        return dict(self.stats, memory_entries=len(self._memory), hit_rate=hits / lookups if lookups else 0.0)
+
+
+cache = LLMCache()
+
+metrics.registry.callback(
+    "finai_llm_cache_lookups_total", "LLM response cache lookups by result", "counter",
+    lambda: {(result,): n for result, n in cache.stats.items()}, ("result",),
+)
@@ -0,0 +1,146 @@
+# matcher.py
+# Compiled matchers for the regex tier: one alternation per intent and an
+# Aho-Corasick automaton over category keywords, so a message is scanned once
+# no matter how many keywords there are. Users' own category names are merged
+# into per-user automata, cached here and dropped when a category is added.
+import os
+import re
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Iterable, Mapping, Optional
+
+VOCAB_CACHE_SIZE = int(os.getenv("VOCAB_CACHE_SIZE", "1024"))
+# Categories added by another process (Mini App) are picked up after this TTL
+VOCAB_TTL = int(os.getenv("VOCAB_TTL", "300"))
+# Shorter user category names would match inside unrelated words
+VOCAB_MIN_KEYWORD = 3
+
+
+def normalize(text: str) -> str:
+    return text.lower().replace("ё", "е")
+
+
+class IntentMatcher:
+    """Patterns of each intent compiled into one regex; intents are tried in order."""
+
+    def __init__(self, patterns: Mapping[str, Iterable[str]]):
+        self._compiled = [
+            (intent, re.compile("|".join(f"(?:{p})" for p in group)))
+            for intent, group in patterns.items()
+        ]
+
+    def match(self, text: str) -> Optional[str]:
+        t = text.lower()
+        for intent, regex in self._compiled:
+            if regex.search(t):
+                return intent
+        return None
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton: keyword -> label, substring semantics.
+    first() returns the label of the earliest-listed keyword found in the text,
+    same as looping over the keywords in order, in a single pass over the text.
+    """
+
+    def __init__(self, keywords: Mapping[str, str]):
+        goto = [{}]
+        best = [None]  # node -> (priority, label) of the best keyword ending here
+        for priority, (keyword, label) in enumerate(keywords.items()):
+            node = 0
+            for ch in normalize(keyword):
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    best.append(None)
+                node = nxt
+            if node and (best[node] is None or priority < best[node][0]):
+                best[node] = (priority, label)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[child] = goto[f].get(ch, 0) if node else 0
+                inherited = best[fail[child]]
+                if inherited is not None and (best[child] is None or inherited[0] < best[child][0]):
+                    best[child] = inherited
+                queue.append(child)
+
+        self._goto = goto
+        self._fail = fail
+        self._best = best
+        self.size = len(keywords)
+
+    @classmethod
+    def from_categories(cls, categories: Mapping[str, Iterable[str]], extra: Iterable[str] = ()) -> "KeywordAutomaton":
+        """
+        {category: [keywords]} in priority order. extra — user's own category
+        names, matched as keywords of themselves and ahead of the built-in ones.
+        """
+        keywords = {}
+        for name in extra:
+            if len(name.strip()) >= VOCAB_MIN_KEYWORD:
+                keywords.setdefault(normalize(name.strip()), name)
+        for category, words in categories.items():
+            for word in words:
+                keywords.setdefault(normalize(word), category)
+        return cls(keywords)
+
+    def first(self, text: str) -> Optional[str]:
+        goto, fail, best = self._goto, self._fail, self._best
+        node, found = 0, None
+        for ch in normalize(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = best[node]
+            if hit is not None and (found is None or hit[0] < found[0]):
+                found = hit
+                if found[0] == 0:
+                    break
+        return found[1] if found else None
+
+
+class VocabularyCache:
+    """LRU of per-user automata with a TTL; invalidate() on category changes."""
+
+    def __init__(self, size: int = VOCAB_CACHE_SIZE, ttl: int = VOCAB_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> (expires_at, automaton)
+        self._lock = threading.Lock()
+
+    def get(self, user_id) -> Optional[KeywordAutomaton]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id, automaton: KeywordAutomaton) -> KeywordAutomaton:
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, automaton)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return automaton
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+vocabularies = VocabularyCache()
@@ -0,0 +1,271 @@
+# metrics.py
+# In-process counters and latency histograms, exported in the Prometheus text
+# format from a small aiohttp endpoint inside the bot process.
+#   with metrics.timed(metrics.STAGE_SECONDS, stage="ocr"): ...
+#   @metrics.timed(metrics.HANDLER_SECONDS)          # handler=<function name>
+#   METRICS_PORT=9108 python bot.py; curl localhost:9108/metrics
+import os
+import time
+import asyncio
+import logging
+import functools
+import threading
+from typing import Callable, Dict, Iterable, Tuple
+
+import tracing
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 = no endpoint
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# Seconds; the LLM and OCR tails live in the upper buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()  # sync storage calls and the OCR pool report from threads
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def header(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> Iterable[str]:
+        yield from self.header()
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram(_Metric):
+    """Cumulative buckets + sum + count per label set; errors go to <name>_errors_total."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # key -> [counts per bucket..., +Inf count, sum]
+        base = name[:-len("_seconds")] if name.endswith("_seconds") else name
+        self.errors = Counter(f"{base}_errors_total", f"Failures of: {help}", self.labelnames + ("error",))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            else:
+                row[len(self.buckets)] += 1
+            row[-1] += value
+
+    def count(self, **labels) -> int:
+        return sum(self._values.get(self._key(labels), [0, 0])[:-1])
+
+    def render(self) -> Iterable[str]:
+        yield from self.header()
+        for key, row in sorted(self._values.items()):
+            running = 0
+            for bound, n in zip(self.buckets + ("+Inf",), row):
+                running += n
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {running}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {row[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {running}"
+        yield from self.errors.render()
+
+
+class CallbackMetric(_Metric):
+    """Values read at scrape time from fn() -> {label values tuple: number}; for existing stats dicts."""
+
+    def __init__(self, name: str, help: str, kind: str, fn: Callable[[], Dict[Tuple, float]],
+                 labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def render(self) -> Iterable[str]:
+        try:
+            values = self.fn()
+        except Exception as e:
+            logging.warning(f"[METRICS] {self.name} collect failed: {e}")
+            return
+        yield from self.header()
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name: str, help: str, kind: str, fn, labelnames: Iterable[str] = ()) -> CallbackMetric:
+        """kind: "gauge" or "counter"; re-registering a name replaces the old callback."""
+        return self._add(CallbackMetric(name, help, kind, fn, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HANDLER_SECONDS = registry.histogram("finai_handler_seconds", "Telegram update handler latency", ("handler",))
+LLM_SECONDS = registry.histogram("finai_llm_request_seconds", "LLM API call latency, retries included", ("call",))
+LLM_TOKENS = registry.counter("finai_llm_tokens_total", "Tokens reported in LLM responses", ("type",))
+STAGE_SECONDS = registry.histogram("finai_stage_seconds", "OCR / ASR / parsing stage latency", ("stage",))
+TELEGRAM_SECONDS = registry.histogram("finai_telegram_api_seconds", "Bot API call latency", ("method",))
+STORAGE_SECONDS = registry.histogram("finai_storage_seconds", "Storage call latency", ("backend", "op"))
+
+
+def record_usage(data: Dict):
+    """Token counts from an OpenAI-style response body ("usage" block), if the provider sent one."""
+    usage = data.get("usage") or {}
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind):
+            LLM_TOKENS.inc(usage[kind], type=kind[:-len("_tokens")])
+
+
+class timed:
+    """
+    Observes the duration of a block or call into a Histogram and counts
+    exceptions by type. Works as `with`, `async with`, and as a decorator on
+    sync and async functions; as a decorator, label names that were not given
+    are filled with the function's name. Inside a traced update it also opens
+    a span named after the label values (tracing.py).
+    """
+
+    def __init__(self, metric: Histogram, **labels):
+        self.metric = metric
+        self.labels = labels
+
+    @staticmethod
+    def _begin(labels: Dict):
+        return time.perf_counter(), tracing.start_span(".".join(str(v) for v in labels.values()))
+
+    def _done(self, state, labels: Dict, exc: BaseException = None):
+        started, span = state
+        self.metric.observe(time.perf_counter() - started, **labels)
+        if exc is not None and not isinstance(exc, asyncio.CancelledError):
+            self.metric.errors.inc(error=type(exc).__name__, **labels)
+        tracing.end_span(span, exc)
+
+    def __enter__(self):
+        self._state = self._begin(self.labels)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._done(self._state, self.labels, exc)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+    def __call__(self, fn):
+        labels = dict({n: fn.__name__ for n in self.metric.labelnames}, **self.labels)
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                state = self._begin(labels)
+                try:
+                    result = await fn(*args, **kwargs)
+                except BaseException as e:
+                    self._done(state, labels, e)
+                    raise
+                self._done(state, labels)
+                return result
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            state = self._begin(labels)
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                self._done(state, labels, e)
+                raise
+            self._done(state, labels)
+            return result
+        return wrapper
+
+
+def instrument(metric: Histogram, **labels):
+    """Class decorator: timed() on every public method defined by the class (op=<method name>)."""
+
+    def decorate(cls):
+        for name, attr in list(vars(cls).items()):
+            if not name.startswith("_") and callable(attr) and not isinstance(attr, (staticmethod, classmethod, type)):
+                setattr(cls, name, timed(metric, **labels)(attr))
+        return cls
+    return decorate
+
+
+async def start_server(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    """GET /metrics on the running event loop; returns the aiohttp runner (cleanup() on shutdown) or None."""
+    if not port:
+        return None
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(body=registry.render().encode(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"[METRICS] http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,182 @@
+# mongo_schema.py
+# Схема finance_app и построители запросов MongoDB — общие для database.py
+# (синхронный MongoClient) и storage_mongo.MongoStorage (AsyncMongoClient),
+# чтобы оба пути писали одно и то же. Модуль не создаёт клиента: MongoStorage
+# импортирует его, не открывая лишний синхронный MongoClient.
+import os
+import math
+from datetime import datetime, date as date_cls
+
+from bson.objectid import ObjectId
+from dotenv import load_dotenv
+from pymongo import ASCENDING, IndexModel, InsertOne, UpdateOne
+
+load_dotenv()
+MONGO_URI = os.getenv("MONGO_URI")
+
+DB_NAME = "finance_app"
+
+# Профиль пользователя без истории: старые документы ещё могут
+# содержать встроенный массив transactions (до migrate_embedded_transactions)
+USER_PROJECTION = {"transactions": 0}
+TX_PROJECTION = {"tg_id": 0}
+TX_SORT = [("date", ASCENDING), ("_id", ASCENDING)]
+# Категории, суммы по которым считаются доходом (см. CATEGORY_KEYWORDS в ai.py)
+INCOME_CATEGORIES = ["income"]
+# Категория транзакции, пришедшей без неё (как ai.extract_category)
+DEFAULT_CATEGORY = "others"
+
+# Индексы по коллекциям; add_category опирается на уникальность tg_id
+INDEXES = {
+    "users": [IndexModel("tg_id", unique=True)],
+    "transactions": [IndexModel(
+        [("tg_id", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)], name="tg_id_date",
+    )],
+    "rollups": [IndexModel(
+        [("tg_id", ASCENDING), ("month", ASCENDING), ("category", ASCENDING)],
+        name="tg_id_month_category", unique=True,
+    )],
+}
+
+
+def date_str(value):
+    if isinstance(value, (datetime, date_cls)):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, str):
+        return value[:10]  # ISO datetime от LLM -> "YYYY-MM-DD"
+    return value
+
+
+def as_amount(value):
+    """Сумма как число; None, если её нет или это не число (ответ LLM)."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        try:
+            value = float(str(value).replace(",", "."))
+        except ValueError:
+            return None
+    return value if math.isfinite(value) else None
+
+
+# -------------------------------
+# Пользователь и категории
+# -------------------------------
+def profile(name: str):
+    return {"name": name, "categories": []}
+
+
+def user_upsert(tg_id: int, name: str):
+    """(filter, update) для create_user: профиль создаётся, только если его нет."""
+    return {"tg_id": tg_id}, {"$setOnInsert": profile(name)}
+
+
+def version_bump(tg_id: int, db_name: str = DB_NAME):
+    """
+    Подъём users.version — по ней Mini App сбрасывает кэш. Уходит в том же
+    запросе, что и сама запись (transaction_writes); для нового пользователя
+    этот же upsert создаёт профиль.
+    """
+    return UpdateOne(
+        {"tg_id": tg_id},
+        {"$setOnInsert": profile("Unknown"), "$inc": {"version": 1}},
+        upsert=True,
+        namespace=f"{db_name}.users",
+    )
+
+
+def category_push(tg_id: int, name: str):
+    """
+    (filter, update) для add_category одним upsert: фильтр совпадает, только
+    если такой категории ещё нет. Если пользователь есть и категория уже
+    есть — upsert упирается в уникальный индекс tg_id, это и есть ответ
+    "уже есть" (DuplicateKeyError).
+    """
+    return (
+        {"tg_id": tg_id, "categories.name": {"$ne": name}},
+        {
+            "$setOnInsert": {"name": "Unknown"},
+            "$push": {"categories": {"_id": ObjectId(), "name": name}},
+            "$inc": {"version": 1},
+        },
+    )
+
+
+# -------------------------------
+# Транзакции
+# -------------------------------
+def tx_doc(tg_id: int, item: dict, today: str) -> dict:
+    return {
+        "_id": ObjectId(),
+        "tg_id": tg_id,
+        "amount": as_amount(item.get("amount")),
+        "category": item.get("category") or DEFAULT_CATEGORY,
+        "date": date_str(item.get("date") or today)
+    }
+
+
+def transaction_writes(txs, db_name: str = DB_NAME):
+    """
+    Все записи пачки транзакций по порядку, как [(коллекция, операция)]:
+    вставки, свёртки (rollup_ops) и версия данных каждого пользователя пачки.
+    Операции несут namespace: на MongoDB 8.0+ это один client.bulk_write,
+    на старых серверах — bulk_write по коллекциям (writes_by_collection).
+    Запись не атомарна: если она оборвётся после вставки (сбой сервера,
+    а на старых серверах и процесса между запросами), свёртки отстанут
+    от транзакций — это исправляет database.rebuild_rollups.
+    """
+    writes = [("transactions", InsertOne(tx, namespace=f"{db_name}.transactions")) for tx in txs]
+    writes += [("rollups", op) for op in rollup_ops(txs, db_name)]
+    writes += [("users", version_bump(tg_id, db_name)) for tg_id in dict.fromkeys(tx["tg_id"] for tx in txs)]
+    return writes
+
+
+def writes_by_collection(writes):
+    grouped = {}
+    for name, op in writes:
+        grouped.setdefault(name, []).append(op)
+    return grouped
+
+
+def tx_filter(tg_id: int, date_from=None, date_to=None) -> dict:
+    query = {"tg_id": tg_id}
+    date_range = {}
+    if date_from:
+        date_range["$gte"] = date_str(date_from)
+    if date_to:
+        date_range["$lte"] = date_str(date_to)
+    if date_range:
+        query["date"] = date_range
+    return query
+
+
+def tx_page_filter(tg_id: int, date_from=None, date_to=None, after: dict = None) -> dict:
+    query = tx_filter(tg_id, date_from, date_to)
+    if after is not None:
+        query["$or"] = [
+            {"date": {"$gt": after["date"]}},
+            {"date": after["date"], "_id": {"$gt": after["_id"]}},
+        ]
+    return query
+
+
+# -------------------------------
+# Месячные свёртки
+# -------------------------------
+def rollup_ops(txs, db_name: str = DB_NAME):
+    """
+    UpdateOne-upsert на каждый (tg_id, month, category) из пачки транзакций.
+    Транзакция без числовой суммы считается с нулём, как apply_rollups в db.py.
+    """
+    deltas = {}
+    for tx in txs:
+        key = (tx["tg_id"], tx["date"][:7], tx["category"])
+        total, count = deltas.get(key, (0, 0))
+        deltas[key] = (total + (as_amount(tx.get("amount")) or 0), count + 1)
+    return [
+        UpdateOne(
+            {"tg_id": tg_id, "month": month, "category": category},
+            {"$inc": {"total": total, "count": count}},
+            upsert=True,
+            namespace=f"{db_name}.rollups",
+        )
+        for (tg_id, month, category), (total, count) in deltas.items()
+    ]
@@ -0,0 +1,223 @@
+# ocr.py
+# OCR чеков: tesseract в ограниченном пуле процессов, чтобы распознавание
+# не блокировало event loop бота, предобработка изображения и кэш
+# результатов по хэшу содержимого или file_unique_id из Telegram.
+import os
+import io
+import time
+import asyncio
+import shutil
+import hashlib
+import logging
+import functools
+import importlib.util
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+import metrics
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+OCR_LANG = os.getenv("OCR_LANG", "rus+eng")
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "512"))
+# Tesseract лучше всего работает при ~300 DPI; у фото из Telegram DPI нет,
+# поэтому для них ограничиваем длинную сторону.
+OCR_TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", "300"))
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2000"))
+TESSERACT_CMD = os.getenv("TESSERACT_CMD", "tesseract")
+
+
+# pytesseract (тянет pandas) и PIL импортируются при первом распознавании,
+# а не при импорте модуля: старт бота и рабочих процессов пула быстрее.
+@functools.lru_cache(maxsize=None)
+def available() -> bool:
+    """Установлены pytesseract и Pillow и найден бинарник tesseract (без импорта пакетов)."""
+    packages = all(importlib.util.find_spec(name) is not None for name in ("pytesseract", "PIL"))
+    return packages and shutil.which(TESSERACT_CMD) is not None
+
+
+def _otsu_threshold(img: "Image.Image") -> int:
+    hist = img.histogram()
+    total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    sum_bg, weight_bg, best, threshold = 0, 0, 0.0, 127
+    for i, h in enumerate(hist):
+        weight_bg += h
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += i * h
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if between > best:
+            best, threshold = between, i
+    return threshold
+
+
+def preprocess(image_bytes: bytes) -> "Image.Image":
+    """Поворот по EXIF, оттенки серого, масштаб к целевому DPI, бинаризация (Otsu)."""
+    from PIL import Image, ImageOps
+
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes)))
+    img = img.convert("L")
+
+    dpi = img.info.get("dpi")
+    scale = 1.0
+    if dpi and dpi[0]:
+        scale = OCR_TARGET_DPI / float(dpi[0])
+    longest = max(img.size)
+    if longest * scale > OCR_MAX_SIDE:
+        scale = OCR_MAX_SIDE / longest
+    if abs(scale - 1.0) > 0.05:
+        size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+        img = img.resize(size, Image.LANCZOS)
+
+    img = ImageOps.autocontrast(img)
+    threshold = _otsu_threshold(img)
+    return img.point(lambda p: 255 if p > threshold else 0, mode="1")
+
+
+def run_ocr(image_bytes: bytes, lang: str = OCR_LANG) -> Tuple[str, float, float]:
+    """Предобработка + tesseract. Возвращает (текст, мс предобработки, мс OCR)."""
+    t0 = time.perf_counter()
+    try:
+        import pytesseract
+
+        pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+        img = preprocess(image_bytes)
+        t1 = time.perf_counter()
+        text = pytesseract.image_to_string(img, lang=lang)
+    except Exception as e:
+        # исключения pytesseract не всегда переживают pickle и роняют пул
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+    t2 = time.perf_counter()
+    return text, (t1 - t0) * 1000, (t2 - t1) * 1000
+
+
+def content_key(image_bytes: bytes) -> str:
+    return "sha256:" + hashlib.sha256(image_bytes).hexdigest()
+
+
+class OcrEngine:
+    """
+    Асинхронный фасад над пулом процессов tesseract.
+    Одинаковые изображения (по key или хэшу) распознаются один раз:
+    повторы берутся из LRU-кэша, а одновременные запросы ждут общий результат.
+    """
+
+    def __init__(self, workers: int = OCR_WORKERS, cache_size: int = OCR_CACHE_SIZE, lang: str = OCR_LANG):
+        self.workers = workers
+        self.cache_size = cache_size
+        self.lang = lang
+        self._executor = None
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self.queued = 0
+        self.stats = {"images": 0, "cache_hits": 0, "errors": 0,
+                      "preprocess_ms": 0.0, "ocr_ms": 0.0, "wait_ms": 0.0}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: не копируем в рабочие процессы сокеты и потоки бота
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        text = self._cache.get(key)
+        if text is not None:
+            self._cache.move_to_end(key)
+            self.stats["cache_hits"] += 1
+        return text
+
+    def _cache_put(self, key: str, text: str):
+        self._cache[key] = text
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    @metrics.timed(metrics.STAGE_SECONDS, stage="ocr")
+    async def recognize(self, image_bytes: bytes, key: str = None) -> str:
+        """
+        Текст с изображения. key — например file_unique_id фото в Telegram.
+        Распознавание идёт отдельной задачей, общей для одновременных запросов:
+        отмена одного обработчика снимает только его ожидание (shield).
+        """
+        key = key or content_key(image_bytes)
+        text = self._cache_get(key)
+        if text is not None:
+            return text
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._recognize(key, bytes(image_bytes)))
+        return await asyncio.shield(task)
+
+    async def _recognize(self, key: str, image_bytes: bytes) -> str:
+        self.queued += 1
+        started = time.perf_counter()
+        try:
+            text, prep_ms, ocr_ms = await asyncio.get_running_loop().run_in_executor(
+                self._pool(), run_ocr, image_bytes, self.lang
+            )
+        except BrokenProcessPool as e:
+            self._executor = None  # упавший пул не восстанавливается сам
+            self.stats["errors"] += 1
+            logging.error(f"OCR pool broken: {e}")
+            text, prep_ms, ocr_ms = "", 0.0, 0.0
+        except Exception as e:
+            self.stats["errors"] += 1
+            logging.error(f"OCR error: {e}")
+            text, prep_ms, ocr_ms = "", 0.0, 0.0
+        finally:
+            self.queued -= 1
+            del self._inflight[key]
+
+        total_ms = (time.perf_counter() - started) * 1000
+        wait_ms = max(0.0, total_ms - prep_ms - ocr_ms)
+        self.stats["images"] += 1
+        self.stats["preprocess_ms"] += prep_ms
+        self.stats["ocr_ms"] += ocr_ms
+        self.stats["wait_ms"] += wait_ms
+        logging.info(f"[OCR] {key[:24]} queue={self.queued} wait={wait_ms:.0f}ms "
+                     f"prep={prep_ms:.0f}ms ocr={ocr_ms:.0f}ms")
+        if text:
+            self._cache_put(key, text)
+        return text
+
+    @metrics.timed(metrics.STAGE_SECONDS, stage="ocr")
+    def recognize_sync(self, image_bytes: bytes, key: str = None) -> str:
+        """Синхронный вариант для не-async кода (utils.ocr_image_bytes): в текущем процессе, с кэшем."""
+        key = key or content_key(image_bytes)
+        text = self._cache_get(key)
+        if text is None:
+            text, _, _ = run_ocr(image_bytes, self.lang)
+            # пустой текст (сбой tesseract) не кэшируем, как и _recognize
+            if text:
+                self._cache_put(key, text)
+        return text
+
+    def snapshot(self) -> dict:
+        """Глубина очереди, попадания в кэш и средние времена на изображение."""
+        n = max(1, self.stats["images"])
+        return {
+            "queued": self.queued,
+            "cached": len(self._cache),
+            "images": self.stats["images"],
+            "cache_hits": self.stats["cache_hits"],
+            "errors": self.stats["errors"],
+            "avg_preprocess_ms": self.stats["preprocess_ms"] / n,
+            "avg_ocr_ms": self.stats["ocr_ms"] / n,
+            "avg_wait_ms": self.stats["wait_ms"] / n,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+engine = OcrEngine()
@@ -0,0 +1,109 @@
+# profiling.py
+# On-demand profiling of a running bot: cProfile (CPU, event-loop thread) or
+# tracemalloc (allocation growth) for a time window, report written to
+# PROFILE_DIR. Triggered by the admin /profile command (bot.py) or a signal:
+#   kill -USR1 <pid>   # CPU profile for PROFILE_SECONDS
+#   kill -USR2 <pid>   # memory profile for PROFILE_SECONDS
+import io
+import os
+import time
+import signal
+import asyncio
+import logging
+import pstats
+import cProfile
+import tracemalloc
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_SECONDS = float(os.getenv("PROFILE_SECONDS", "30"))
+PROFILE_MAX_SECONDS = 600
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "40"))
+PROFILE_FRAMES = 10  # traceback depth kept by tracemalloc
+
+MODES = ("cpu", "mem")
+
+
+class Profiler:
+    """One profiling window at a time; run() returns the path of the text report."""
+
+    def __init__(self, out_dir: str = PROFILE_DIR):
+        self.out_dir = out_dir
+        self.running = None  # mode of the window in progress
+
+    async def run(self, seconds: float = PROFILE_SECONDS, mode: str = "cpu") -> str:
+        if mode not in MODES:
+            raise ValueError(f"unknown profile mode: {mode}")
+        if self.running:
+            raise RuntimeError(f"{self.running} profile already running")
+        seconds = max(1.0, min(seconds, PROFILE_MAX_SECONDS))
+        self.running = mode
+        try:
+            report = await (self._cpu(seconds) if mode == "cpu" else self._mem(seconds))
+        finally:
+            self.running = None
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"{mode}-{time.strftime('%Y%m%d-%H%M%S')}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(report)
+        logging.info(f"[PROFILE] {mode} {seconds:.0f}s -> {path}")
+        return path
+
+    async def _cpu(self, seconds: float) -> str:
+        # Only the event-loop thread: handlers, parsing, storage callbacks.
+        # OCR processes and to_thread workers (ASR, sync Mongo) are not included.
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+        out = io.StringIO()
+        out.write(f"CPU profile, {seconds:.0f}s window, event-loop thread\n\n")
+        stats = pstats.Stats(profile, stream=out)
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+        stats.sort_stats("tottime").print_stats(PROFILE_TOP)
+        return out.getvalue()
+
+    async def _mem(self, seconds: float) -> str:
+        started_here = not tracemalloc.is_tracing()
+        if started_here:
+            tracemalloc.start(PROFILE_FRAMES)
+        try:
+            before = tracemalloc.take_snapshot()
+            await asyncio.sleep(seconds)
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if started_here:
+                tracemalloc.stop()
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+        lines = [f"Memory profile, {seconds:.0f}s window: traced {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB", ""]
+        lines.append(f"Top {PROFILE_TOP} allocation growth by line:")
+        lines += [str(stat) for stat in diff[:PROFILE_TOP]]
+        lines += ["", f"Top {PROFILE_TOP} live allocations by line:"]
+        lines += [str(stat) for stat in after.filter_traces(filters).statistics("lineno")[:PROFILE_TOP]]
+        return "\n".join(lines) + "\n"
+
+
+profiler = Profiler()
+_tasks = set()  # the loop keeps only weak references to tasks
+
+
+def install_signal_handlers(loop: asyncio.AbstractEventLoop = None, seconds: float = PROFILE_SECONDS):
+    """SIGUSR1 -> CPU window, SIGUSR2 -> memory window; no-op where signals are unsupported (Windows)."""
+    loop = loop or asyncio.get_running_loop()
+
+    def trigger(mode: str):
+        if profiler.running:
+            logging.warning(f"[PROFILE] {profiler.running} profile already running, {mode} ignored")
+            return
+        task = loop.create_task(profiler.run(seconds, mode))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+
+    for name, mode in (("SIGUSR1", "cpu"), ("SIGUSR2", "mem")):
+        try:
+            loop.add_signal_handler(getattr(signal, name), trigger, mode)
+        except (AttributeError, NotImplementedError, RuntimeError):
+            logging.info(f"[PROFILE] {name} is not available, use /profile")
@@ -0,0 +1,200 @@
+# scheduler.py
+# Планировщик дорогих этапов (LLM, OCR, ASR): глобальный лимит одновременных
+# задач на ресурс, честная очередь по пользователям (round-robin, внутри
+# пользователя — FIFO) и token bucket под квоту OpenRouter. Один пользователь,
+# засыпающий бота фотографиями, ждёт своей очереди и не тормозит остальных.
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional
+
+import metrics
+import tracing
+
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+# Квота OpenRouter (запросов в минуту) и допустимый всплеск; 0 — без ограничения
+LLM_RPM = float(os.getenv("LLM_RPM", "20"))
+LLM_BURST = int(os.getenv("LLM_BURST", "5"))
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", os.getenv("OCR_WORKERS", "2")))
+ASR_CONCURRENCY = int(os.getenv("ASR_CONCURRENCY", os.getenv("ASR_RECOGNIZERS", "2")))
+# Начиная с такой глубины очереди пользователю сразу отвечаем "в очереди"
+SCHED_BUSY_DEPTH = int(os.getenv("SCHED_BUSY_DEPTH", "3"))
+# Больше стольких ожидающих задач одного пользователя на ресурс — отказ
+SCHED_MAX_USER_QUEUE = int(os.getenv("SCHED_MAX_USER_QUEUE", "5"))
+
+
+class QueueFull(Exception):
+    """У пользователя слишком много задач в очереди ресурса."""
+
+    def __init__(self, resource: str):
+        super().__init__(f"{resource} queue is full")
+        self.resource = resource
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше burst про запас."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class FairLimiter:
+    """
+    Не больше capacity задач одновременно. Ожидающие хранятся по пользователям;
+    освободившийся слот получает следующий по кругу пользователь.
+    """
+
+    def __init__(self, name: str, capacity: int, bucket: Optional[TokenBucket] = None,
+                 busy_depth: int = SCHED_BUSY_DEPTH, max_user_queue: int = SCHED_MAX_USER_QUEUE):
+        self.name = name
+        self.capacity = capacity
+        self.bucket = bucket
+        self.busy_depth = busy_depth
+        self.max_user_queue = max_user_queue
+        self.active = 0
+        self.queued = 0
+        self._waiters = OrderedDict()  # user_id -> deque[Future]
+        self.stats = {"granted": 0, "waited": 0, "rejected": 0, "max_queued": 0,
+                      "wait_ms": 0.0, "max_wait_ms": 0.0}
+
+    async def acquire(self, user_id, on_queued: Callable[[int], Awaitable] = None):
+        if self.active < self.capacity and not self.queued:
+            self.active += 1
+            self.stats["granted"] += 1
+            return
+        waiters = self._waiters.setdefault(user_id, deque())
+        if len(waiters) >= self.max_user_queue:
+            if not waiters:
+                del self._waiters[user_id]
+            self.stats["rejected"] += 1
+            raise QueueFull(self.name)
+        future = asyncio.get_running_loop().create_future()
+        waiters.append(future)
+        self.queued += 1
+        self.stats["max_queued"] = max(self.stats["max_queued"], self.queued)
+        started = time.perf_counter()
+        try:
+            if on_queued is not None and self.queued >= self.busy_depth:
+                try:
+                    await on_queued(self.queued)
+                except Exception as e:
+                    logging.warning(f"[SCHED] busy notice failed: {e}")
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # слот уже выдан — передаём дальше
+            else:
+                self._forget(user_id, future)
+            raise
+        wait_ms = (time.perf_counter() - started) * 1000
+        self.stats["granted"] += 1
+        self.stats["waited"] += 1
+        self.stats["wait_ms"] += wait_ms
+        self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], wait_ms)
+        logging.info(f"[SCHED] {self.name} user={user_id} waited {wait_ms:.0f}ms queue={self.queued}")
+
+    def _forget(self, user_id, future):
+        waiters = self._waiters.get(user_id)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            self.queued -= 1
+            if not waiters:
+                del self._waiters[user_id]
+
+    def release(self):
+        while self._waiters:
+            user_id, waiters = next(iter(self._waiters.items()))
+            future = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                self._waiters.move_to_end(user_id)
+            else:
+                del self._waiters[user_id]
+            if not future.done():
+                future.set_result(None)  # слот переходит к ожидающему, active не меняется
+                return
+        self.active -= 1
+
+    def snapshot(self) -> dict:
+        waited = max(1, self.stats["waited"])
+        return {
+            "active": self.active,
+            "capacity": self.capacity,
+            "queued": self.queued,
+            "users_queued": len(self._waiters),
+            "max_queued": self.stats["max_queued"],
+            "granted": self.stats["granted"],
+            "rejected": self.stats["rejected"],
+            "avg_wait_ms": self.stats["wait_ms"] / waited,
+            "max_wait_ms": self.stats["max_wait_ms"],
+        }
+
+
+class Scheduler:
+    def __init__(self):
+        self.limiters = {}
+
+    def add(self, name: str, capacity: int, rpm: float = 0, burst: int = 1) -> FairLimiter:
+        bucket = TokenBucket(rpm / 60, burst) if rpm > 0 else None
+        self.limiters[name] = FairLimiter(name, capacity, bucket)
+        return self.limiters[name]
+
+    @asynccontextmanager
+    async def slot(self, resource: str, user_id, on_queued: Callable[[int], Awaitable] = None):
+        """
+        async with scheduler.slot("ocr", user.id, on_queued=...): ...
+        on_queued(позиция) вызывается, если очередь глубже SCHED_BUSY_DEPTH.
+        """
+        limiter = self.limiters[resource]
+        # Ожидание в очереди и в token bucket — отдельные спаны трейса апдейта
+        with tracing.span(f"queue.{resource}"):
+            await limiter.acquire(user_id, on_queued)
+        try:
+            if limiter.bucket is not None:
+                with tracing.span(f"ratelimit.{resource}"):
+                    await limiter.bucket.acquire()
+            yield
+        finally:
+            limiter.release()
+
+    def snapshot(self) -> dict:
+        """Занятость, глубина очереди и время ожидания по каждому ресурсу."""
+        return {name: limiter.snapshot() for name, limiter in self.limiters.items()}
+
+
+scheduler = Scheduler()
+scheduler.add("llm", LLM_CONCURRENCY, rpm=LLM_RPM, burst=LLM_BURST)
+scheduler.add("ocr", OCR_CONCURRENCY)
+scheduler.add("asr", ASR_CONCURRENCY)
+
+# Снимок очередей для /metrics: занятость и глубина — gauge, выдачи и отказы — счётчики
+for _field, _kind, _name in (
+    ("active", "gauge", "finai_scheduler_active"),
+    ("capacity", "gauge", "finai_scheduler_capacity"),
+    ("queued", "gauge", "finai_scheduler_queued"),
+    ("granted", "counter", "finai_scheduler_granted_total"),
+    ("rejected", "counter", "finai_scheduler_rejected_total"),
+):
+    metrics.registry.callback(
+        _name, f"Scheduler {_field} per resource", _kind,
+        lambda field=_field: {(name,): snap[field] for name, snap in scheduler.snapshot().items()},
+        ("resource",),
+    )
@@ -0,0 +1,112 @@
+# storage.py
+# Асинхронный API хранилища для ботов: обработчики aiogram/PTB делают
+# await, и медленная база задерживает только того пользователя, чья
+# запись выполняется, а не весь event loop.
+#
+#   MongoStorage — та же схема, что в database.py, на AsyncMongoClient (storage_mongo.py)
+#   SqlStorage   — схема db.py на SQLAlchemy asyncio, aiosqlite для SQLite (storage_sql.py)
+#
+# Все методы возвращают простые dict: транзакция — {"_id", "amount",
+# "category", "date" ("YYYY-MM-DD")}, категория — {"_id", "name"}.
+import os
+import asyncio
+import importlib
+from typing import Protocol, Optional, List, Dict, Any
+
+from dotenv import load_dotenv
+
+load_dotenv()
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sql")
+
+
+class Storage(Protocol):
+    async def create_user(self, tg_id: int, name: str = "Unknown") -> Dict[str, Any]: ...
+    async def add_category(self, tg_id: int, name: str) -> Optional[str]: ...
+    async def get_categories(self, tg_id: int) -> List[Dict[str, Any]]: ...
+    async def add_transaction(self, tg_id: int, amount: float, category: str, date: str = None) -> Dict[str, Any]: ...
+    async def add_transactions(self, tg_id: int, items) -> List[Dict[str, Any]]: ...
+    async def add_batch(self, entries) -> List[Dict[str, Any]]: ...
+    async def get_transactions(self, tg_id: int, date_from=None, date_to=None,
+                               limit: int = None, after: dict = None) -> List[Dict[str, Any]]: ...
+
+
+# -------------------------------
+# Отложенная пакетная запись
+# -------------------------------
+class WriteBehindQueue:
+    """
+    Собирает add_transaction, пришедшие в пределах window секунд (или до
+    max_batch штук), и пишет их одним storage.add_batch. Каждый
+    вызывающий получает свою транзакцию, как от add_transaction.
+    """
+
+    def __init__(self, storage: Storage, window: float, max_batch: int = 100):
+        self.storage = storage
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+
+    async def add_transaction(self, tg_id: int, amount: float, category: str, date: str = None):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((tg_id, {"amount": amount, "category": category, "date": date}, future))
+        if len(self._pending) >= self.max_batch:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            results = await self.storage.add_batch([(tg_id, item) for tg_id, item, _ in batch])
+        except Exception as e:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (*_, future), tx in zip(batch, results):
+            if not future.done():
+                future.set_result(tx)
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+
+
+_storages = {}
+
+
+def get_storage(backend: str = None) -> Storage:
+    """Один экземпляр хранилища на backend ("sql" | "mongo") в процессе."""
+    backend = backend or STORAGE_BACKEND
+    if backend not in _storages:
+        if backend == "mongo":
+            from storage_mongo import MongoStorage
+            _storages[backend] = MongoStorage()
+        elif backend == "sql":
+            from storage_sql import SqlStorage
+            _storages[backend] = SqlStorage()
+        else:
+            raise ValueError(f"Unknown storage backend: {backend}")
+    return _storages[backend]
+
+
+# Бэкенды импортируются лениво (pymongo / SQLAlchemy — сотни миллисекунд
+# на старте), но остаются доступны как storage.MongoStorage и т.п.
+_LAZY = {"MongoStorage": "storage_mongo", "SqlStorage": "storage_sql", "async_url": "storage_sql"}
+
+
+def __getattr__(name: str):
+    if name in _LAZY:
+        return getattr(importlib.import_module(_LAZY[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,103 @@
+# storage_mongo.py
+# MongoStorage (см. storage.py): схема mongo_schema.py на AsyncMongoClient.
+# Отдельный модуль: процесс с STORAGE_BACKEND=sql не импортирует pymongo.
+# database.py (синхронный MongoClient, создаётся при импорте) сюда тоже не
+# импортируется: общие построители запросов живут в mongo_schema.py.
+from datetime import datetime
+
+from pymongo import AsyncMongoClient, ReturnDocument
+from pymongo.errors import DuplicateKeyError, InvalidOperation
+
+import mongo_schema
+from matcher import vocabularies
+import metrics
+
+
+def _today() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+@metrics.instrument(metrics.STORAGE_SECONDS, backend="mongo")
+class MongoStorage:
+    """Запросы строят общие помощники mongo_schema.py; здесь только их асинхронное выполнение."""
+
+    def __init__(self, uri: str = None):
+        self.client = AsyncMongoClient(uri or mongo_schema.MONGO_URI)
+        self.db = self.client[mongo_schema.DB_NAME]
+        self.users = self.db["users"]
+        self.transactions = self.db["transactions"]
+        self.rollups = self.db["rollups"]
+        self._client_bulk = True  # см. database._write_transactions
+        self._indexes_ready = False
+
+    async def _require_indexes(self):
+        # см. database._require_indexes: upsert'ы профиля опираются на уникальный tg_id
+        if not self._indexes_ready:
+            await self.ensure_indexes()
+
+    async def _write_transactions(self, txs):
+        await self._require_indexes()
+        writes = mongo_schema.transaction_writes(txs, self.db.name)
+        if self._client_bulk:
+            try:
+                await self.client.bulk_write([op for _, op in writes])
+                return
+            except InvalidOperation:
+                self._client_bulk = False
+        for name, ops in mongo_schema.writes_by_collection(writes).items():
+            await self.db[name].bulk_write(ops)
+
+    async def create_user(self, tg_id: int, name: str = "Unknown"):
+        await self._require_indexes()
+        query, update = mongo_schema.user_upsert(tg_id, name)
+        user = await self.users.find_one_and_update(
+            query, update,
+            projection=mongo_schema.USER_PROJECTION,
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return user
+
+    async def add_category(self, tg_id: int, name: str):
+        await self._require_indexes()
+        try:
+            await self.users.update_one(*mongo_schema.category_push(tg_id, name), upsert=True)
+        except DuplicateKeyError:
+            return None
+        vocabularies.invalidate(tg_id)
+        return name
+
+    async def get_categories(self, tg_id: int):
+        user = await self.users.find_one({"tg_id": tg_id}, {"categories": 1})
+        return (user or {}).get("categories", [])
+
+    async def add_batch(self, entries):
+        """entries — список (tg_id, item); одна пачка на несколько пользователей."""
+        today = _today()
+        txs = [mongo_schema.tx_doc(tg_id, item, today) for tg_id, item in entries]
+        if not txs:
+            return []
+        await self._write_transactions(txs)
+        return txs
+
+    async def add_transaction(self, tg_id: int, amount: float, category: str, date: str = None):
+        txs = await self.add_batch([(tg_id, {"amount": amount, "category": category, "date": date})])
+        return txs[0]
+
+    async def add_transactions(self, tg_id: int, items):
+        return await self.add_batch([(tg_id, item) for item in items])
+
+    async def get_transactions(self, tg_id: int, date_from=None, date_to=None, limit: int = None, after: dict = None):
+        query = mongo_schema.tx_page_filter(tg_id, date_from, date_to, after)
+        cursor = self.transactions.find(query, mongo_schema.TX_PROJECTION).sort(mongo_schema.TX_SORT)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=None)
+
+    async def ensure_indexes(self):
+        for name, indexes in mongo_schema.INDEXES.items():
+            await self.db[name].create_indexes(indexes)
+        self._indexes_ready = True
+
+    async def close(self):
+        await self.client.close()
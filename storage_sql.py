@@ -0,0 +1,192 @@
+# storage_sql.py
+# SqlStorage (см. storage.py): схема db.py на SQLAlchemy asyncio (aiosqlite
+# для SQLite). Отдельный модуль: процесс с STORAGE_BACKEND=mongo не
+# импортирует SQLAlchemy и ORM-модели db.py.
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Any
+
+from sqlalchemy import event, insert, select, and_, or_
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+import db
+from matcher import vocabularies
+import metrics
+
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_url(url: str) -> str:
+    """sqlite:///x.db -> sqlite+aiosqlite:///x.db (драйвер, если не указан явно)."""
+    scheme, rest = url.split(":", 1)
+    return ASYNC_DRIVERS.get(scheme, scheme) + ":" + rest
+
+
+@metrics.instrument(metrics.STORAGE_SECONDS, backend="sql")
+class SqlStorage:
+    def __init__(self, url: str = None):
+        url = url or os.getenv("ASYNC_DATABASE_URL") or async_url(db.DATABASE_URL)
+        if url.startswith("sqlite"):
+            self.engine = create_async_engine(url, connect_args={"check_same_thread": False})
+            event.listen(self.engine.sync_engine, "connect", db._apply_sqlite_pragmas)
+        else:
+            self.engine = create_async_engine(
+                url, pool_size=db.POOL_SIZE, max_overflow=db.POOL_MAX_OVERFLOW,
+                pool_recycle=db.POOL_RECYCLE, pool_pre_ping=True,
+            )
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        # users.id по telegram_id и categories.id по (users.id, имя); id не
+        # меняются, пополняем только после успешного commit
+        self._user_ids = {}
+        self._category_ids = {}
+
+    @staticmethod
+    def _tx_dict(tx) -> Dict[str, Any]:
+        return {"_id": tx.id, "amount": tx.amount, "category": tx.category, "date": tx.date.strftime("%Y-%m-%d")}
+
+    async def _user_id(self, session, tg_id: int, name: str, created: dict) -> int:
+        user_id = self._user_ids.get(tg_id) or created.get(("user", tg_id))
+        if user_id is not None:
+            return user_id
+        dialect_insert = db.conflict_insert(self.engine.dialect.name)
+        if dialect_insert is not None:
+            # Первые апдейты нового пользователя приходят параллельно: INSERT ... ON CONFLICT
+            # вместо "SELECT, потом INSERT", иначе второй падает на unique(telegram_id)
+            await session.execute(
+                dialect_insert(db.User).values(telegram_id=tg_id, first_name=name)
+                .on_conflict_do_nothing(index_elements=["telegram_id"])
+            )
+        user_id = (await session.execute(select(db.User.id).where(db.User.telegram_id == tg_id))).scalar()
+        if user_id is None:
+            user = db.User(telegram_id=tg_id, first_name=name)
+            session.add(user)
+            await session.flush()
+            user_id = user.id
+        created[("user", tg_id)] = user_id
+        return user_id
+
+    async def _ensure_categories(self, session, user_id: int, names, created: dict) -> set:
+        """Создаёт недостающие категории одним INSERT; возвращает имена созданных."""
+        unknown = [name for name in names if (user_id, name) not in self._category_ids]
+        if not unknown:
+            return set()
+        found = dict((await session.execute(
+            select(db.Category.name, db.Category.id).where(db.Category.user_id == user_id, db.Category.name.in_(unknown))
+        )).all())
+        missing = [{"user_id": user_id, "name": name} for name in unknown if name not in found]
+        inserted = {}
+        if missing:
+            dialect_insert = db.conflict_insert(self.engine.dialect.name)
+            if dialect_insert is None:
+                stmt = insert(db.Category)
+            else:
+                # Параллельная запись могла успеть создать ту же категорию:
+                # её строка не вернётся из RETURNING, id дочитываем ниже
+                stmt = dialect_insert(db.Category).on_conflict_do_nothing(index_elements=["user_id", "name"])
+            inserted = dict((await session.execute(stmt.returning(db.Category.name, db.Category.id), missing)).all())
+            found.update(inserted)
+        raced = [name for name in unknown if name not in found]
+        if raced:
+            found.update((await session.execute(
+                select(db.Category.name, db.Category.id).where(db.Category.user_id == user_id, db.Category.name.in_(raced))
+            )).all())
+        for name in unknown:
+            created[("category", user_id, name)] = found[name]
+        return set(inserted)
+
+    def _remember(self, created: dict):
+        for key, value in created.items():
+            if key[0] == "user":
+                self._user_ids[key[1]] = value
+            else:
+                self._category_ids[key[1:]] = value
+
+    async def create_user(self, tg_id: int, name: str = "Unknown"):
+        created = {}
+        async with self.sessions() as session, session.begin():
+            user_id = await self._user_id(session, tg_id, name, created)
+            user = await session.get(db.User, user_id)
+        self._remember(created)
+        return {"_id": user.id, "tg_id": user.telegram_id, "name": user.first_name or "Unknown"}
+
+    async def add_category(self, tg_id: int, name: str):
+        created = {}
+        async with self.sessions() as session, session.begin():
+            user_id = await self._user_id(session, tg_id, "Unknown", created)
+            inserted = await self._ensure_categories(session, user_id, [name], created)
+        self._remember(created)
+        if inserted:
+            vocabularies.invalidate(tg_id)
+        return name if inserted else None
+
+    async def get_categories(self, tg_id: int):
+        async with self.sessions() as session:
+            rows = await session.execute(
+                select(db.Category.id, db.Category.name).join(db.User, db.User.id == db.Category.user_id)
+                .where(db.User.telegram_id == tg_id).order_by(db.Category.id)
+            )
+            return [{"_id": cat_id, "name": name} for cat_id, name in rows]
+
+    async def add_batch(self, entries):
+        """entries — список (tg_id, item); всё пишется одной транзакцией БД, строки — одним executemany."""
+        if not entries:
+            return []
+        created = {}
+        today = db.as_day(datetime.now())
+        async with self.sessions() as session, session.begin():
+            rows = []
+            for tg_id, item in entries:
+                user_id = await self._user_id(session, tg_id, "Unknown", created)
+                rows.append({
+                    "user_id": user_id,
+                    "amount": item["amount"],
+                    "category": item.get("category") or db.DEFAULT_CATEGORY,
+                    "date": db.as_day(item["date"]) if item.get("date") else today,
+                    "source": "telegram_bot",
+                })
+            by_user = {}
+            for row in rows:
+                by_user.setdefault(row["user_id"], set()).add(row["category"])
+            for user_id, names in by_user.items():
+                await self._ensure_categories(session, user_id, names, created)
+            txs = (await session.scalars(
+                insert(db.Transaction).returning(db.Transaction, sort_by_parameter_order=True), rows
+            )).all()
+            # Core-вставка идёт мимо before_flush, свёртки обновляем явно
+            await session.run_sync(db.apply_rollups, rows)
+        self._remember(created)
+        return [self._tx_dict(tx) for tx in txs]
+
+    async def add_transaction(self, tg_id: int, amount: float, category: str, date: str = None):
+        txs = await self.add_batch([(tg_id, {"amount": amount, "category": category, "date": date})])
+        return txs[0]
+
+    async def add_transactions(self, tg_id: int, items):
+        return await self.add_batch([(tg_id, item) for item in items])
+
+    async def get_transactions(self, tg_id: int, date_from=None, date_to=None, limit: int = None, after: dict = None):
+        stmt = select(db.Transaction).join(db.User, db.User.id == db.Transaction.user_id).where(db.User.telegram_id == tg_id)
+        if date_from:
+            stmt = stmt.where(db.Transaction.date >= db.as_day(date_from))
+        if date_to:
+            # граница включительная по дню, как в database.get_transactions
+            stmt = stmt.where(db.Transaction.date < db.as_day(date_to) + timedelta(days=1))
+        if after is not None:
+            after_date = db.as_day(after["date"])
+            stmt = stmt.where(or_(
+                db.Transaction.date > after_date,
+                and_(db.Transaction.date == after_date, db.Transaction.id > after["_id"]),
+            ))
+        stmt = stmt.order_by(db.Transaction.date, db.Transaction.id)
+        if limit:
+            stmt = stmt.limit(limit)
+        async with self.sessions() as session:
+            return [self._tx_dict(tx) for tx in (await session.scalars(stmt)).all()]
+
+    async def ensure_indexes(self):
+        async with self.engine.begin() as conn:
+            await conn.run_sync(db.create_schema)
+
+    async def close(self):
+        await self.engine.dispose()
@@ -0,0 +1,173 @@
+# tracing.py
+# Per-update trace spans: handler -> download -> queue -> OCR/ASR -> parse ->
+# LLM -> storage -> reply. A trace is kept when it is head-sampled
+# (TRACE_SAMPLE_RATE) or when the whole update took longer than TRACE_SLOW_MS;
+# kept traces are appended to TRACE_PATH as JSONL, one span per line.
+#   @tracing.root on a handler starts the trace for its update
+#   with tracing.span("download"): ...   (metrics.timed opens spans too)
+import os
+import json
+import time
+import random
+import logging
+import functools
+import threading
+import contextvars
+from typing import Dict, Optional, Tuple
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+# Slow updates are always kept; 0 = head sampling only (no spans for unsampled updates)
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "5000"))
+TRACE_PATH = os.getenv("TRACE_PATH", "./traces.jsonl")
+
+_current = contextvars.ContextVar("trace_span", default=None)
+_write_lock = threading.Lock()
+
+
+class Trace:
+    __slots__ = ("trace_id", "sampled", "spans")
+
+    def __init__(self, sampled: bool):
+        self.trace_id = "%032x" % random.getrandbits(128)
+        self.sampled = sampled
+        self.spans = []  # finished spans; list.append is safe from worker threads
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attrs", "start", "_t0", "duration_ms", "error")
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], attrs: Dict):
+        self.trace = trace
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.duration_ms = None
+        self.error = None
+
+    def finish(self, error: BaseException = None):
+        self.duration_ms = (time.perf_counter() - self._t0) * 1000
+        if error is not None:
+            self.error = type(error).__name__
+        self.trace.spans.append(self)
+
+    def to_dict(self) -> Dict:
+        d = {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round(self.duration_ms, 3),
+        }
+        if self.attrs:
+            d["attrs"] = self.attrs
+        if self.error:
+            d["error"] = self.error
+        return d
+
+
+SpanHandle = Optional[Tuple[Span, contextvars.Token]]
+
+
+def start_span(name: str, **attrs) -> SpanHandle:
+    """Child of the current span; None (and next to no cost) outside a trace."""
+    parent = _current.get()
+    if parent is None:
+        return None
+    span = Span(parent.trace, name, parent.span_id, attrs)
+    return span, _current.set(span)
+
+
+def end_span(handle: SpanHandle, error: BaseException = None):
+    if handle is None:
+        return
+    span, token = handle
+    span.finish(error)
+    try:
+        _current.reset(token)
+    except ValueError:
+        _current.set(None)  # ended in another context (callback, generator): just detach
+
+
+def annotate(**attrs):
+    """Adds attributes to the current span, if any (e.g. parse tier, cache hit)."""
+    span = _current.get()
+    if span is not None:
+        span.attrs.update(attrs)
+
+
+class span:
+    """with tracing.span("download", size=n): ... — a no-op outside a trace."""
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self) -> Optional[Span]:
+        self._handle = start_span(self.name, **self.attrs)
+        return self._handle[0] if self._handle else None
+
+    def __exit__(self, exc_type, exc, tb):
+        end_span(self._handle, exc)
+        return False
+
+
+def begin_trace(name: str, **attrs) -> SpanHandle:
+    """Root span of a new trace, or None when the update is not traced / already inside a trace."""
+    if _current.get() is not None:
+        return None  # a handler called from another traced handler stays part of the running trace
+    sampled = random.random() < TRACE_SAMPLE_RATE
+    if not sampled and TRACE_SLOW_MS <= 0:
+        return None
+    root = Span(Trace(sampled), name, None, attrs)
+    return root, _current.set(root)
+
+
+def finish_trace(handle: SpanHandle, error: BaseException = None):
+    if handle is None:
+        return
+    end_span(handle, error)
+    root = handle[0]
+    if root.trace.sampled or root.duration_ms >= TRACE_SLOW_MS > 0:
+        root.attrs["sampled"] = root.trace.sampled
+        write(root.trace)
+
+
+def write(trace: Trace, path: str = None):
+    lines = "".join(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + "\n" for s in trace.spans)
+    try:
+        with _write_lock, open(path or TRACE_PATH, "a", encoding="utf-8") as f:
+            f.write(lines)
+    except OSError as e:
+        logging.warning(f"[TRACE] write failed: {e}")
+
+
+def _update_attrs(args) -> Dict:
+    """update_id / user of a PTB Update or an aiogram Message, whichever the handler got first."""
+    obj = args[0] if args else None
+    attrs = {}
+    if getattr(obj, "update_id", None) is not None:
+        attrs["update_id"] = obj.update_id
+    user = getattr(obj, "effective_user", None) or getattr(obj, "from_user", None)
+    if user is not None:
+        attrs["user"] = user.id
+    return attrs
+
+
+def root(fn):
+    """Decorator for async update handlers: one trace per update."""
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        handle = begin_trace(fn.__name__, **_update_attrs(args))
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            finish_trace(handle, e)
+            raise
+        finish_trace(handle)
+        return result
+    return wrapper
@@ -0,0 +1,130 @@
+# updates.py
+# Update delivery shared by both bots: polling (development) or a webhook on a
+# local HTTP server behind the HTTPS reverse proxy, and concurrent processing
+# that keeps each user's updates in arrival order. Different users run in
+# parallel (up to BOT_CONCURRENT_UPDATES); one user's updates run one at a
+# time, so "/add 250 кофе" and the next message never race. On shutdown the
+# bots stop receiving, then drain() lets in-flight updates finish.
+#   BOT_MODE=webhook WEBHOOK_URL=https://bot.example.com python bot.py
+import os
+import hmac
+import asyncio
+import hashlib
+import logging
+from contextlib import asynccontextmanager, nullcontext
+from typing import Dict, Hashable, Optional
+
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # polling | webhook
+# Updates handled at once; expensive stages are additionally capped by scheduler.py
+BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "64"))
+# Accepted but not finished updates (running + waiting for their user's turn)
+BOT_PENDING_UPDATES = int(os.getenv("BOT_PENDING_UPDATES", "1024"))
+# Seconds to let in-flight updates finish on shutdown
+DRAIN_SECONDS = float(os.getenv("DRAIN_SECONDS", "30"))
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # public https base URL, proxied to WEBHOOK_LISTEN:WEBHOOK_PORT
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+MODES = ("polling", "webhook")
+if BOT_MODE not in MODES:
+    raise ValueError(f"BOT_MODE must be one of {MODES}, got {BOT_MODE!r}")
+
+
+def webhook_url() -> str:
+    if not WEBHOOK_URL:
+        raise RuntimeError("BOT_MODE=webhook needs WEBHOOK_URL (public https URL of the proxy)")
+    return WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH
+
+
+def webhook_secret() -> str:
+    """X-Telegram-Bot-Api-Secret-Token: WEBHOOK_SECRET, or derived from SECRET_KEY (hex fits Telegram's charset)."""
+    secret = os.getenv("WEBHOOK_SECRET")
+    if secret:
+        return secret
+    return hmac.new(os.getenv("SECRET_KEY", "").encode(), b"telegram-webhook", hashlib.sha256).hexdigest()
+
+
+class UserOrdering:
+    """
+    slot(key) admits one update per key at a time, FIFO, and at most `limit`
+    updates overall. The user's turn is taken before the global slot, so a
+    user with a backlog waits in their own line without holding capacity
+    other users could use.
+    """
+
+    def __init__(self, limit: int = BOT_CONCURRENT_UPDATES):
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+        self._locks = {}  # key -> [asyncio.Lock, updates holding or waiting for it]
+        self.in_flight = 0
+        self.running = 0
+        self.processed = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @asynccontextmanager
+    async def slot(self, key: Optional[Hashable]):
+        entry = None
+        if key is not None:
+            entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+            entry[1] += 1
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            async with entry[0] if entry else nullcontext(), self._semaphore or nullcontext():
+                self.running += 1
+                try:
+                    yield
+                finally:
+                    self.running -= 1
+                    self.processed += 1
+        finally:
+            if entry is not None:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+            self.in_flight -= 1
+            if not self.in_flight:
+                self._idle.set()
+
+    async def drain(self, timeout: float = DRAIN_SECONDS) -> bool:
+        """Waits until no update is in flight; False if some were still running after timeout."""
+        if not self.in_flight:
+            return True
+        logging.info(f"[UPDATES] draining {self.in_flight} in-flight updates (up to {timeout:.0f}s)")
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"[UPDATES] drain timed out, {self.in_flight} updates still in flight")
+            return False
+        return True
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "running": self.running,
+            "waiting": self.in_flight - self.running,
+            "users": len(self._locks),
+            "processed": self.processed,
+        }
+
+
+ordering = UserOrdering()
+
+metrics.registry.callback(
+    "finai_updates", "Updates running or waiting for their user's turn / the concurrency limit", "gauge",
+    lambda: {(state,): ordering.snapshot()[state] for state in ("running", "waiting")},
+    ("state",),
+)
+metrics.registry.callback(
+    "finai_updates_processed_total", "Updates processed", "counter",
+    lambda: {(): ordering.processed},
+)
@@ -6,19 +6,12 @@ import base64
 from typing import Dict, Any
 from dotenv import load_dotenv
 from datetime import datetime
-import pytesseract
-from PIL import Image
-import io
-import soundfile as sf
-try:
-    from vosk import Model, KaldiRecognizer
-    VOSK_AVAILABLE = True
-except Exception:
-    VOSK_AVAILABLE = False
+import ocr
+import asr
+from asr import VOSK_AVAILABLE, VOSK_MODEL_PATH
 
 load_dotenv()
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "./models/vosk-small-ru")
 
 def verify_telegram_init_data(init_data: str) -> Dict[str, Any]:
     """
@@ -46,47 +39,23 @@ def verify_telegram_init_data(init_data: str) -> Dict[str, Any]:
         raise ValueError("Invalid init data signature")
     return data
 
-# OCR for images (pytesseract)
+# OCR for images (pytesseract): preprocessing + content-hash cache from ocr.py.
+# Async callers should use `await ocr.engine.recognize(...)` instead.
+# ocr/asr import pytesseract, PIL, soundfile and vosk only on first use, so
+# callers that need just verify_telegram_init_data / safe_float stay light.
 def ocr_image_bytes(image_bytes: bytes) -> str:
+    if not ocr.available():
+        return ""
     try:
-        img = Image.open(io.BytesIO(image_bytes))
-        text = pytesseract.image_to_string(img, lang='rus+eng')
-        return text
+        return ocr.engine.recognize_sync(image_bytes)
     except Exception as e:
         return ""
 
-# Offline transcription using Vosk (wav bytes)
+# Offline transcription using Vosk (wav / ogg-opus bytes): resident model from asr.py
 def transcribe_audio_bytes(audio_bytes: bytes, sample_rate=16000) -> str:
-    if not VOSK_AVAILABLE:
+    if not asr.available():
         return ""
-    # Ensure model loaded
-    model = Model(VOSK_MODEL_PATH)
-    rec = KaldiRecognizer(model, sample_rate)
-    # read file samples
-    import wave, tempfile
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
-        tmp.write(audio_bytes)
-        tmp.flush()
-        wf = wave.open(tmp.name, "rb")
-        results = []
-        while True:
-            data = wf.readframes(4000)
-            if len(data) == 0:
-                break
-            if rec.AcceptWaveform(data):
-                results.append(rec.Result())
-        results.append(rec.FinalResult())
-        # aggregate
-        import json
-        texts = []
-        for r in results:
-            try:
-                jr = json.loads(r)
-                if 'text' in jr:
-                    texts.append(jr['text'])
-            except:
-                continue
-        return " ".join(texts)
+    return asr.engine.transcribe(audio_bytes)
 
 # helper: safe parse float
 def safe_float(v):